@@ -0,0 +1,133 @@
+"""
+Concurrent read/write benchmark for engine profiles: users paging keyboards and history
+while others save sets, default SQLite settings vs. the tuned profile from db.engine.
+
+    python -m bench.bench_engine --readers 200 --writers 20 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from sqlalchemy import and_, create_engine as create_sync_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.future import select
+
+from db.engine import EngineProfile, create_engine
+from db.models import Base, BodyPart, Exercise, History, User
+
+ENGINES = {
+    # как было в db/connect.py: без опций (rollback journal, NullPool)
+    "default": lambda url: create_async_engine(url),
+    "tuned": lambda url: create_engine(url, EngineProfile()),
+}
+
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def seed(path: str, users: int, body_parts: int, ex_per_bp: int, history: int) -> None:
+    engine = create_sync_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(BodyPart.__table__.insert(), [{"id": b, "name": f"bp{b}"} for b in range(1, body_parts + 1)])
+        conn.execute(User.__table__.insert(),
+                     [{"id": u, "user_id": u, "user_name": f"u{u}"} for u in range(1, users + 1)])
+        conn.execute(Exercise.__table__.insert(), [
+            {"user_id": u, "bp_id": b, "name": f"ex{u}_{b}_{e}"}
+            for u in range(1, users + 1) for b in range(1, body_parts + 1) for e in range(ex_per_bp)
+        ])
+        rnd = random.Random(1)
+        total_ex = users * body_parts * ex_per_bp
+        rows = []
+        for _ in range(history):
+            ex = rnd.randrange(total_ex)
+            user = ex // (body_parts * ex_per_bp) + 1
+            rows.append({"user_id": user, "bp_id": 1, "exercise_id": ex + 1, "note": "100(8)-90(7)"})
+        conn.execute(History.__table__.insert(), rows)
+    engine.dispose()
+
+
+async def run(name: str, args) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        seed(path, args.users, args.body_parts, args.ex_per_bp, args.history)
+
+        engine = ENGINES[name](f"sqlite+aiosqlite:///{path}")
+        session_maker = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        reads, writes = [], []
+        errors = 0
+        deadline = time.perf_counter() + args.seconds
+
+        async def reader(seed_: int) -> None:
+            nonlocal errors
+            rnd = random.Random(seed_)
+            while time.perf_counter() < deadline:
+                user = rnd.randrange(args.users) + 1
+                bp = rnd.randrange(args.body_parts) + 1
+                t = time.perf_counter()
+                try:
+                    async with session_maker() as session:
+                        exs = (await session.execute(
+                            select(Exercise.id, Exercise.name).where(and_(Exercise.user_id == user,
+                                                                          Exercise.bp_id == bp))
+                        )).all()
+                        await session.execute(
+                            select(History.created_at, History.note)
+                            .where(and_(History.user_id == user, History.exercise_id == exs[0].id))
+                            .order_by(History.created_at.desc()).limit(10)
+                        )
+                except Exception:
+                    errors += 1
+                reads.append((time.perf_counter() - t) * 1000)
+
+        async def writer(seed_: int) -> None:
+            nonlocal errors
+            rnd = random.Random(seed_)
+            while time.perf_counter() < deadline:
+                user = rnd.randrange(args.users) + 1
+                t = time.perf_counter()
+                try:
+                    async with session_maker() as session:
+                        session.add(History(user_id=user, bp_id=1, exercise_id=1, note="100(8)"))
+                        await session.commit()
+                except Exception:
+                    errors += 1
+                writes.append((time.perf_counter() - t) * 1000)
+                await asyncio.sleep(args.think_ms / 1000)
+
+        await asyncio.gather(*(reader(i) for i in range(args.readers)),
+                             *(writer(10000 + i) for i in range(args.writers)))
+        await engine.dispose()
+
+    print(f"{name:<8} reads {len(reads) / args.seconds:8.0f}/s p50 {statistics.median(reads):7.2f} ms "
+          f"p99 {percentile(reads, 0.99):8.2f} ms | writes {len(writes) / args.seconds:6.0f}/s "
+          f"p50 {statistics.median(writes):7.2f} ms p99 {percentile(writes, 0.99):8.2f} ms | errors {errors}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--readers", type=int, default=200)
+    parser.add_argument("--writers", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--think-ms", type=float, default=10)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--body-parts", type=int, default=6)
+    parser.add_argument("--ex-per-bp", type=int, default=5)
+    parser.add_argument("--history", type=int, default=200_000)
+    args = parser.parse_args()
+
+    for name in ENGINES:
+        await run(name, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
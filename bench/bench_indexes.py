@@ -0,0 +1,143 @@
+"""
+Seeds a temporary SQLite database with synthetic history and measures
+the hot queries from bot.py before and after the composite indexes.
+
+    python -m bench.bench_indexes --rows 2000000 --users 2000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine
+
+from db.models import Base
+
+INDEXES = [
+    index
+    for table in ("exercise", "history")
+    for index in Base.metadata.tables[table].indexes
+]
+
+QUERIES = {
+    "history preview": (
+        "SELECT created_at, note FROM history WHERE user_id = ? AND exercise_id = ? "
+        "ORDER BY created_at DESC LIMIT 10",
+        lambda ctx: (ctx["user"], ctx["exercise"]),
+    ),
+    "today stat": (
+        "SELECT exercise_id, note FROM history WHERE user_id = ? AND created_at >= ?",
+        lambda ctx: (ctx["user"], ctx["today"]),
+    ),
+    "exercise picker": (
+        "SELECT id, name FROM exercise WHERE user_id = ? AND bp_id = ?",
+        lambda ctx: (ctx["user"], ctx["bp"]),
+    ),
+}
+
+
+def seed(path: str, rows: int, users: int, body_parts: int, ex_per_bp: int) -> None:
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        for index in INDEXES:
+            index.drop(conn)
+    engine.dispose()
+
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    conn.executemany("INSERT INTO body_part (id, name) VALUES (?, ?)",
+                     [(b, f"bp{b}") for b in range(1, body_parts + 1)])
+    conn.executemany("INSERT INTO user (id, user_id, user_name) VALUES (?, ?, ?)",
+                     [(u, 1000 + u, f"u{u}") for u in range(1, users + 1)])
+    exercises = []
+    ex_id = 0
+    for u in range(1, users + 1):
+        for b in range(1, body_parts + 1):
+            for e in range(ex_per_bp):
+                ex_id += 1
+                exercises.append((ex_id, u, b, f"ex{ex_id}"))
+    conn.executemany("INSERT INTO exercise (id, user_id, bp_id, name) VALUES (?, ?, ?, ?)", exercises)
+
+    start = datetime.now() - timedelta(days=3 * 365)
+    span = 3 * 365 * 24 * 3600
+    rnd = random.Random(42)
+    chunk = 100_000
+    for offset in range(0, rows, chunk):
+        batch = []
+        for _ in range(min(chunk, rows - offset)):
+            ex, user, bp, _ = exercises[rnd.randrange(len(exercises))]
+            created = start + timedelta(seconds=rnd.randrange(span))
+            batch.append((created.isoformat(" "), user, bp, ex, "100(8)-90(7)"))
+        conn.executemany(
+            "INSERT INTO history (created_at, user_id, bp_id, exercise_id, note) VALUES (?, ?, ?, ?, ?)",
+            batch,
+        )
+        conn.commit()
+    conn.close()
+
+
+def measure(path: str, users: int, body_parts: int, ex_per_bp: int, repeat: int) -> dict:
+    conn = sqlite3.connect(path)
+    rnd = random.Random(7)
+    today = datetime.combine(datetime.today(), datetime.min.time()).isoformat(" ")
+    result = {}
+    for name, (sql, params) in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            user = rnd.randrange(users) + 1
+            bp = rnd.randrange(body_parts) + 1
+            ctx = {
+                "user": user,
+                "bp": bp,
+                "exercise": ((user - 1) * body_parts + bp - 1) * ex_per_bp + 1,
+                "today": today,
+            }
+            t = time.perf_counter()
+            conn.execute(sql, params(ctx)).fetchall()
+            timings.append((time.perf_counter() - t) * 1000)
+        plan = " / ".join(row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params(ctx)))
+        result[name] = (statistics.median(timings), max(timings), plan)
+    conn.close()
+    return result
+
+
+def report(title: str, result: dict) -> None:
+    print(f"\n{title}")
+    for name, (median, worst, plan) in result.items():
+        print(f"  {name:<16} median {median:9.3f} ms  max {worst:9.3f} ms  | {plan}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--body-parts", type=int, default=6)
+    parser.add_argument("--ex-per-bp", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        t = time.perf_counter()
+        seed(path, args.rows, args.users, args.body_parts, args.ex_per_bp)
+        print(f"seeded {args.rows} history rows in {time.perf_counter() - t:.1f}s")
+
+        report("without indexes", measure(path, args.users, args.body_parts, args.ex_per_bp, args.repeat))
+
+        engine = create_engine(f"sqlite:///{path}")
+        with engine.begin() as conn:
+            for index in INDEXES:
+                index.create(conn)
+        engine.dispose()
+
+        report("with indexes", measure(path, args.users, args.body_parts, args.ex_per_bp, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
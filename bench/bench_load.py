@@ -0,0 +1,165 @@
+"""
+Load test of the real dispatcher from bot.py: simulated users run full flows
+(/start -> body part -> back -> body part -> exercise list -> exercise -> note -> save) through
+dp.feed_update with an in-process Bot session and a temp SQLite database seeded at the given scale.
+Reports throughput, p50/p95/p99 per step (handler), SQL statements and Bot API calls per step and per flow.
+With --write-behind the saves go through the write-behind queue; the run fails if no row was queued.
+
+    python -m bench.bench_load --users 1000 --flows 3 --concurrency 50 --exercises 12 --history 50
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+_tmp = tempfile.TemporaryDirectory()
+DB_PATH = os.path.join(_tmp.name, "bench.db")
+os.environ["async_db_url"] = f"sqlite+aiosqlite:///{DB_PATH}"
+# троттлинг рассчитан на живого пользователя, а не на симуляцию
+os.environ["throttle_rate"] = os.environ["throttle_burst"] = "1000000"
+
+from aiogram import Bot  # noqa: E402
+from aiogram.types import Update  # noqa: E402
+from sqlalchemy import create_engine, insert, select  # noqa: E402
+
+from bench.fake_telegram import BOT_TOKEN, FakeSession, callback_update, message_update  # noqa: E402
+from bot import dp  # noqa: E402
+from db.models import Base, BodyPart, Exercise, History, User  # noqa: E402
+from db.writer import writer  # noqa: E402
+from metrics import RequestMetricsMiddleware, count_queries, count_requests  # noqa: E402
+
+BODY_PARTS = 10
+TG_ID_BASE = 10_000
+STEPS = ("start", "body_part", "back", "body_part", "exercise_list", "exercise", "note", "save")
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def seed(users: int, exercises: int, history: int) -> dict[int, list[tuple[int, int]]]:
+    """
+    Creates users with exercises and history, returns tg id -> [(exercise id, body part id)].
+    """
+    rnd = random.Random(1)
+    engine = create_engine(f"sqlite:///{DB_PATH}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(BodyPart), [{"name": f"bp{i}"} for i in range(BODY_PARTS)])
+        conn.execute(insert(User), [{"user_id": TG_ID_BASE + i, "user_name": f"u{i}"} for i in range(users)])
+        db_users = dict(conn.execute(select(User.user_id, User.id)).all())
+        conn.execute(insert(Exercise), [
+            {"user_id": db_users[TG_ID_BASE + i], "bp_id": j % BODY_PARTS + 1, "name": f"exercise {i}-{j}"}
+            for i in range(users) for j in range(exercises)
+        ])
+        rows = conn.execute(select(Exercise.id, Exercise.user_id, Exercise.bp_id)).all()
+        for start in range(0, len(rows), 500):
+            conn.execute(insert(History), [
+                {"user_id": r.user_id, "bp_id": r.bp_id, "exercise_id": r.id,
+                 "note": f"{rnd.randint(40, 120)}({rnd.randint(5, 12)})-{rnd.randint(40, 120)}({rnd.randint(5, 12)})"}
+                for r in rows[start:start + 500] for _ in range(history)
+            ])
+    engine.dispose()
+
+    by_user = {db_id: tg_id for tg_id, db_id in db_users.items()}
+    result = defaultdict(list)
+    for r in rows:
+        result[by_user[r.user_id]].append((r.id, r.bp_id))
+    return result
+
+
+class Load:
+    def __init__(self, bot: Bot):
+        self.bot = bot
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.queries: dict[str, int] = defaultdict(int)
+        self.requests: dict[str, int] = defaultdict(int)
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+
+    async def step(self, name: str, update: dict) -> None:
+        update = Update.model_validate(update, context={"bot": self.bot})
+        with count_queries() as queries, count_requests() as requests:
+            t = time.perf_counter()
+            await dp.feed_update(self.bot, update)
+            self.latencies[name].append((time.perf_counter() - t) * 1000)
+        self.queries[name] += queries[0]
+        self.requests[name] += requests[0]
+
+    async def flow(self, tg_id: int, exercise: tuple[int, int]) -> None:
+        ex_id, bp_id = exercise
+        message_id = next(self._message_ids)
+        steps = (
+            ("start", message_update(next(self._update_ids), tg_id, "/start", message_id)),
+            ("body_part", callback_update(next(self._update_ids), tg_id, f"bpi:{bp_id}", message_id)),
+            ("back", callback_update(next(self._update_ids), tg_id, "exbk", message_id)),
+            ("body_part", callback_update(next(self._update_ids), tg_id, f"bpi:{bp_id}", message_id)),
+            ("exercise_list", callback_update(next(self._update_ids), tg_id, "exch", message_id)),
+            ("exercise", callback_update(next(self._update_ids), tg_id, f"exi:{ex_id}", message_id)),
+            ("note", message_update(next(self._update_ids), tg_id, "100(8)-90(7)", message_id)),
+            ("save", callback_update(next(self._update_ids), tg_id, "sv:1", message_id)),
+        )
+        for name, update in steps:
+            await self.step(name, update)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--flows", type=int, default=3, help="flows per user")
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--exercises", type=int, default=12, help="exercises per user")
+    parser.add_argument("--history", type=int, default=50, help="history rows per exercise")
+    parser.add_argument("--write-behind", action="store_true")
+    args = parser.parse_args()
+
+    t = time.perf_counter()
+    exercises = seed(args.users, args.exercises, args.history)
+    print(f"seeded {args.users} users x {args.exercises} exercises x {args.history} history rows "
+          f"in {time.perf_counter() - t:.1f}s")
+
+    session = FakeSession()
+    session.middleware(RequestMetricsMiddleware())
+    bot = Bot(token=BOT_TOKEN, session=session)
+    load = Load(bot)
+    if args.write_behind:
+        await writer.start()
+
+    rnd = random.Random(2)
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def user(tg_id: int) -> None:
+        async with semaphore:
+            for _ in range(args.flows):
+                await load.flow(tg_id, rnd.choice(exercises[tg_id]))
+
+    t = time.perf_counter()
+    await asyncio.gather(*(user(TG_ID_BASE + i) for i in range(args.users)))
+    elapsed = time.perf_counter() - t
+    await writer.stop()
+
+    flows = args.users * args.flows
+    updates = flows * len(STEPS)
+    print(f"{flows} flows, {updates} updates in {elapsed:.1f}s: {flows / elapsed:.0f} flows/s, "
+          f"{updates / elapsed:.0f} updates/s")
+    print(f"{'step':<14} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'queries':>8} {'api':>8}")
+    for name in dict.fromkeys(STEPS):
+        lat = load.latencies[name]
+        print(f"{name:<14} {percentile(lat, 0.5):8.2f} {percentile(lat, 0.95):8.2f} {percentile(lat, 0.99):8.2f} "
+              f"{load.queries[name] / len(lat):8.2f} {load.requests[name] / len(lat):8.2f}")
+    print(f"queries per flow: {sum(load.queries.values()) / flows:.2f}, "
+          f"api calls per flow: {sum(session.calls.values()) / flows:.2f}")
+    if args.write_behind:
+        print(f"write-behind: {writer.flushed} rows in {writer.batches} batches")
+        # сохранения из обработчиков должны идти через очередь, иначе сравнение бессмысленно
+        if not writer.flushed:
+            raise SystemExit("write-behind: no rows went through the queue")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,72 @@
+"""
+Dispatch cost per callback update as the number of handlers grows:
+a chain of `startswith` lambda filters vs. CallbackRouter prefix table.
+
+    python -m bench.bench_routing --updates 5000
+"""
+import argparse
+import asyncio
+import random
+import time
+import types
+
+from aiogram import Bot, Dispatcher
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery, Update
+
+from bench.fake_telegram import BOT_TOKEN, callback_update
+from callbacks import CallbackRouter
+
+
+async def noop(callback: CallbackQuery, **kwargs) -> None:
+    pass
+
+
+def linear_dispatcher(handlers: int) -> Dispatcher:
+    dp = Dispatcher()
+    for i in range(handlers):
+        dp.callback_query.register(noop, lambda callback, p=f"p{i}_": callback.data.startswith(p))
+    return dp
+
+
+def router_dispatcher(handlers: int) -> Dispatcher:
+    dp = Dispatcher()
+    router = CallbackRouter()
+    for i in range(handlers):
+        cb = types.new_class(f"Cb{i}", (CallbackData,), {"prefix": f"p{i}"},
+                             lambda ns: ns.update({"__annotations__": {"v": int}}))
+        router.register(cb)(noop)
+    dp.callback_query.register(router.dispatch)
+    return dp
+
+
+async def measure(dp: Dispatcher, bot: Bot, updates: list[Update]) -> float:
+    t = time.perf_counter()
+    for update in updates:
+        await dp.feed_update(bot, update)
+    return (time.perf_counter() - t) / len(updates) * 1e6
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--handlers", type=int, nargs="+", default=[5, 15, 50, 100, 200])
+    args = parser.parse_args()
+
+    bot = Bot(token=BOT_TOKEN)
+    rnd = random.Random(1)
+    print(f"{'handlers':>8} {'linear us/update':>18} {'router us/update':>18}")
+    for n in args.handlers:
+        targets = [rnd.randrange(n) for _ in range(args.updates)]
+        linear = [Update.model_validate(callback_update(i, 1, f"p{t}_{i}"), context={"bot": bot})
+                  for i, t in enumerate(targets)]
+        routed = [Update.model_validate(callback_update(i, 1, f"p{t}:{i}"), context={"bot": bot})
+                  for i, t in enumerate(targets)]
+        linear_us = await measure(linear_dispatcher(n), bot, linear)
+        router_us = await measure(router_dispatcher(n), bot, routed)
+        print(f"{n:>8} {linear_us:>18.1f} {router_us:>18.1f}")
+    await bot.session.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
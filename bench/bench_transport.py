@@ -0,0 +1,108 @@
+"""
+Offline throughput/latency of long polling vs. webhook against the fake Telegram API.
+Every simulated user sends /start, which goes through the real dispatcher from bot.py.
+
+    python -m bench.bench_transport --users 500 --updates 5000
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+DB_PATH = os.path.join(_tmp.name, "bench.db")
+os.environ["async_db_url"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+import aiohttp  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiohttp import web  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+
+import webhook  # noqa: E402
+from bench.fake_telegram import BOT_TOKEN, FakeTelegram, message_update  # noqa: E402
+from bot import dp  # noqa: E402
+from db.models import Base, BodyPart  # noqa: E402
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def prepare_db() -> None:
+    engine = create_engine(f"sqlite:///{DB_PATH}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(BodyPart.__table__.insert(), [{"name": f"bp{i}"} for i in range(10)])
+    engine.dispose()
+
+
+def report(name: str, telegram: FakeTelegram, updates: int, elapsed: float) -> None:
+    lat = telegram.latencies
+    print(f"{name:<8} {updates / elapsed:8.0f} updates/s  p50 {statistics.median(lat):7.2f} ms  "
+          f"p95 {percentile(lat, 0.95):7.2f} ms  p99 {percentile(lat, 0.99):7.2f} ms")
+
+
+async def bench_polling(users: int, updates: int) -> None:
+    telegram = FakeTelegram()
+    await telegram.start()
+    bot = Bot(token=BOT_TOKEN, session=telegram.session())
+    polling = asyncio.create_task(dp.start_polling(bot, handle_signals=False, polling_timeout=1))
+
+    t = time.perf_counter()
+    for i in range(updates):
+        telegram.push(message_update(i + 1, 10_000 + i % users, "/start"))
+    await telegram.wait_replies(updates)
+    elapsed = time.perf_counter() - t
+
+    await dp.stop_polling()
+    await polling
+    await telegram.stop()
+    report("polling", telegram, updates, elapsed)
+
+
+async def bench_webhook(users: int, updates: int, concurrency: int) -> None:
+    telegram = FakeTelegram()
+    await telegram.start()
+    bot = Bot(token=BOT_TOKEN, session=telegram.session())
+
+    runner = web.AppRunner(webhook.build_app(dp, bot, path="/webhook", secret="bench"))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    url = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}/webhook"
+
+    semaphore = asyncio.Semaphore(concurrency)
+    async with aiohttp.ClientSession(headers={"X-Telegram-Bot-Api-Secret-Token": "bench"}) as client:
+        async def post(update: dict) -> None:
+            async with semaphore:
+                telegram.track(update)
+                async with client.post(url, json=update) as resp:
+                    await resp.read()
+
+        t = time.perf_counter()
+        await asyncio.gather(*(post(message_update(i + 1, 10_000 + i % users, "/start")) for i in range(updates)))
+        await telegram.wait_replies(updates)
+        elapsed = time.perf_counter() - t
+
+    await runner.cleanup()
+    await telegram.stop()
+    report("webhook", telegram, updates, elapsed)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=100)
+    args = parser.parse_args()
+
+    prepare_db()
+    await bench_polling(args.users, args.updates)
+    await bench_webhook(args.users, args.updates, args.concurrency)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,89 @@
+"""
+Load test for History inserts: direct commit per callback vs. the write-behind queue.
+
+    python -m bench.bench_writes --saves 5000 --concurrency 200
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_tmp = tempfile.TemporaryDirectory()
+DB_PATH = os.path.join(_tmp.name, "bench.db")
+os.environ["async_db_url"] = f"sqlite+aiosqlite:///{DB_PATH}"
+
+from sqlalchemy import create_engine, func  # noqa: E402
+from sqlalchemy.future import select  # noqa: E402
+
+from db.connect import async_session_maker  # noqa: E402
+from db.models import Base, BodyPart, Exercise, History, User  # noqa: E402
+from db.writer import WriteBehindQueue  # noqa: E402
+
+
+def percentile(values: list, p: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def prepare() -> None:
+    engine = create_engine(f"sqlite:///{DB_PATH}")
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    engine.dispose()
+    async with async_session_maker() as session:
+        session.add_all([User(id=1, user_id=1, user_name="bench"), BodyPart(id=1, name="bp")])
+        await session.commit()
+        session.add(Exercise(id=1, user_id=1, bp_id=1, name="ex"))
+        await session.commit()
+
+
+async def run(saves: int, concurrency: int, writer: WriteBehindQueue, batching: bool) -> None:
+    await prepare()
+    if batching:
+        await writer.start()
+
+    latencies = []
+    failed = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def save_callback(i: int) -> None:
+        nonlocal failed
+        async with semaphore:
+            t = time.perf_counter()
+            try:
+                await writer.add(History(user_id=1, bp_id=1, exercise_id=1, note=f"{i}(8)"))
+            except Exception:
+                # без батчинга параллельные коммиты упираются в блокировку sqlite
+                failed += 1
+            latencies.append((time.perf_counter() - t) * 1000)
+
+    t = time.perf_counter()
+    await asyncio.gather(*(save_callback(i) for i in range(saves)))
+    await writer.stop()
+    elapsed = time.perf_counter() - t
+
+    async with async_session_maker() as session:
+        stored = (await session.execute(select(func.count(History.id)))).scalar()
+
+    print(f"batching {'on ' if batching else 'off'}: {saves / elapsed:9.0f} inserts/s  "
+          f"p50 {statistics.median(latencies):7.2f} ms  p99 {percentile(latencies, 0.99):7.2f} ms  "
+          f"stored {stored}  failed {failed}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--saves", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--flush-ms", type=int, default=50)
+    args = parser.parse_args()
+
+    for batching in (False, True):
+        writer = WriteBehindQueue(batch_size=args.batch_size, flush_interval=args.flush_ms / 1000)
+        await run(args.saves, args.concurrency, writer, batching)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
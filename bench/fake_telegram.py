@@ -0,0 +1,208 @@
+"""
+Local stand-in for the Telegram Bot API, so the bot can be driven offline.
+
+Serves /bot<token>/<method>: getUpdates hands out queued updates (long polling),
+send/edit methods answer with a minimal Message and are counted, everything else returns True.
+FakeSession gives the same answers in-process, without HTTP.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter, defaultdict, deque
+from typing import AsyncGenerator, Optional, cast
+
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.session.base import BaseSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import TelegramType
+from aiohttp import web
+
+BOT_TOKEN = "123456:FAKE-telegram-token-for-benchmarks"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+
+REPLY_METHODS = {"sendmessage", "editmessagetext", "sendphoto", "senddocument", "editmessagereplymarkup"}
+
+
+def message_update(update_id: int, user_id: int, text: str, message_id: int = 1) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"u{user_id}"},
+            "text": text,
+        },
+    }
+
+
+def callback_update(update_id: int, user_id: int, data: str, message_id: int = 1, text: str = "") -> dict:
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "chat_instance": str(user_id),
+            "from": {"id": user_id, "is_bot": False, "first_name": f"u{user_id}", "username": f"u{user_id}"},
+            "data": data,
+            "message": {
+                "message_id": message_id,
+                "date": int(time.time()),
+                "chat": {"id": user_id, "type": "private"},
+                "from": BOT_USER,
+                "text": text or "...",
+            },
+        },
+    }
+
+
+class FakeTelegram:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.host = host
+        self.port = port
+        self.calls: Counter = Counter()
+        self.replies: dict[int, list] = defaultdict(list)
+        self.latencies: list[float] = []
+        self._updates: deque = deque()
+        self._new_updates = asyncio.Event()
+        # chat_id -> время отправки апдейтов, которые еще ждут ответа
+        self._pending: dict[int, deque] = defaultdict(deque)
+        self._message_ids = itertools.count(1000)
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def session(self) -> AiohttpSession:
+        return AiohttpSession(api=TelegramAPIServer.from_base(self.url))
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    def push(self, update: dict) -> None:
+        """
+        Queues an update for getUpdates and remembers when it was sent.
+        """
+        self.track(update)
+        self._updates.append(update)
+        self._new_updates.set()
+
+    def track(self, update: dict) -> None:
+        chat_id = (update.get("message") or update["callback_query"]["message"])["chat"]["id"]
+        self._pending[chat_id].append(time.perf_counter())
+
+    async def wait_replies(self, total: int, timeout: float = 60) -> None:
+        """
+        Waits until `total` replies (send/edit calls) have been received.
+        """
+        deadline = time.perf_counter() + timeout
+        while sum(self.calls[m] for m in REPLY_METHODS) < total:
+            if time.perf_counter() > deadline:
+                raise TimeoutError(f"got {sum(self.calls[m] for m in REPLY_METHODS)} of {total} replies")
+            await asyncio.sleep(0.005)
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        params = dict(await request.post()) if request.can_read_body else {}
+        self.calls[method] += 1
+
+        if method == "getupdates":
+            result = await self._get_updates(params)
+        elif method == "getme":
+            result = BOT_USER
+        elif method in REPLY_METHODS:
+            result = self._reply(method, params)
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list:
+        offset = int(params.get("offset", 0))
+        while self._updates and self._updates[0]["update_id"] < offset:
+            self._updates.popleft()
+        if not self._updates:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(), float(params.get("timeout", 0)) or 0.01)
+            except asyncio.TimeoutError:
+                return []
+        limit = int(params.get("limit", 100))
+        return [u for u in itertools.islice(self._updates, limit) if u["update_id"] >= offset]
+
+    def _reply(self, method: str, params: dict) -> dict:
+        chat_id = int(params.get("chat_id", 0))
+        pending = self._pending.get(chat_id)
+        if pending:
+            self.latencies.append((time.perf_counter() - pending.popleft()) * 1000)
+        self.replies[chat_id].append((method, params))
+        reply_markup = json.loads(params["reply_markup"]) if "reply_markup" in params else None
+        return reply_message(method, chat_id, params.get("message_id") or next(self._message_ids),
+                             params.get("text"), reply_markup)
+
+
+def reply_message(method: str, chat_id: int, message_id: int, text: Optional[str] = None,
+                  reply_markup: Optional[dict] = None) -> dict:
+    message = {
+        "message_id": int(message_id),
+        "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": BOT_USER,
+    }
+    if text is not None:
+        message["text"] = text
+    if reply_markup is not None:
+        message["reply_markup"] = reply_markup
+    if method == "sendphoto":
+        message["photo"] = [{"file_id": f"photo{message['message_id']}", "file_unique_id": "u",
+                             "width": 800, "height": 450}]
+    if method == "senddocument":
+        message["document"] = {"file_id": f"doc{message['message_id']}", "file_unique_id": "u"}
+    return message
+
+
+class FakeSession(BaseSession):
+    """
+    In-process Bot API for driving `dp.feed_update` directly: nothing goes over a socket,
+    answers are built like FakeTelegram's and parsed by the regular response check.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.calls: Counter = Counter()
+        self._message_ids = itertools.count(1000)
+
+    async def make_request(self, bot, method: TelegramMethod[TelegramType], timeout: Optional[int] = None) -> TelegramType:
+        name = method.__api_method__.lower()
+        self.calls[name] += 1
+        if name == "getme":
+            result = BOT_USER
+        elif name in REPLY_METHODS:
+            markup = getattr(method, "reply_markup", None)
+            result = reply_message(name, int(getattr(method, "chat_id", 0) or 0),
+                                   getattr(method, "message_id", None) or next(self._message_ids),
+                                   getattr(method, "text", None),
+                                   markup.model_dump(exclude_none=True) if markup is not None else None)
+        else:
+            result = True
+        response = self.check_response(bot=bot, method=method, status_code=200,
+                                       content=json.dumps({"ok": True, "result": result}))
+        return cast(TelegramType, response.result)
+
+    async def stream_content(self, url: str, headers: Optional[dict] = None, timeout: int = 30,
+                             chunk_size: int = 65536, raise_for_status: bool = True) -> AsyncGenerator[bytes, None]:
+        yield b""
+
+    async def close(self) -> None:
+        pass
@@ -1,11 +1,16 @@
+from startup import startup_timer  # первым импортом: от него считается время старта
+
+import argparse
 import asyncio
+import html
 import logging
-import os
+import sys
 from collections import defaultdict
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 from os import getenv
+from typing import Awaitable, Hashable, Optional
 
-from aiogram import Bot, Dispatcher
+from aiogram import Bot, Dispatcher, F
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.filters import CommandStart, Command
@@ -14,17 +19,27 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.types import Message, FSInputFile
 from aiogram.types.callback_query import CallbackQuery
 from aiogram.utils.keyboard import InlineKeyboardMarkup, InlineKeyboardButton, InlineKeyboardBuilder
-from alembic import command
-from alembic.config import Config
 from dotenv import load_dotenv
 from loguru import logger
-from sqlalchemy import and_
 from sqlalchemy.exc import IntegrityError
-from sqlalchemy.future import select
-from sqlalchemy.orm import joinedload
 
-from db.connect import async_session_maker
-from db.models import User, BodyPart, Exercise, History
+from callbacks import (PAGINATED, BpItem, BpPage, CallbackRouter, ExBack, ExChart, ExChoose, ExCreate, ExHist,
+                       ExItem, ExPage, Save, Stop)
+from db.cache import (PROCESS_CACHES, TTLCache, body_parts_version, exercises_version, get_body_parts, get_exercises,
+                      invalidate_exercises, lists_cache)
+from db.archive import ARCHIVE_AFTER_DAYS, archive_old_history, archive_reader
+from db.connect import engine_async
+from db.fsm import fsm_storage
+from db.handler_data import (clear_state, get_body_part_name, get_exercise_name, load_exercise_view,
+                             load_start_menu, save_note, set_state_data)
+from db.models import Exercise
+from db.queries import get_chart_points, get_history_page, get_last_history_id, iter_stat_rows
+from db.stats import PROGRESS_WEEKS, get_progress
+from db.users import user_resolver
+from db.writer import writer
+from metrics import HandlerMetricsMiddleware, RequestMetricsMiddleware, instrument_engine, registry
+from metrics import serve as serve_metrics
+from middlewares import CallbackThrottleMiddleware
 
 logging.getLogger('sqlalchemy.engine.Engine').setLevel(logging.ERROR)
 
@@ -32,13 +47,32 @@ load_dotenv()
 
 TOKEN = getenv("bot_token")
 dump_key = getenv("dump_key")
-alembic_cfg = Config(getenv("alembic_cfg"))
 
-dp = Dispatcher()
+dp = Dispatcher(storage=fsm_storage)
+throttle = CallbackThrottleMiddleware(rate=float(getenv("throttle_rate", 3)), burst=int(getenv("throttle_burst", 6)),
+                                     dedupe_ttl=600 if PROCESS_CACHES else 0)
+dp.callback_query.outer_middleware(throttle)
+# все callback_query идут через одну таблицу префиксов
+callback_router = CallbackRouter()
+dp.callback_query.register(callback_router.dispatch)
+handler_metrics = HandlerMetricsMiddleware(resolve_callback=callback_router.handler_name)
+dp.message.middleware(handler_metrics)
+dp.callback_query.middleware(handler_metrics)
+instrument_engine(engine_async)
+
+startup_timer.mark("imports")
 
 ITEMS_PER_PAGE = 6
+MESSAGE_LIMIT = 4096
+POLLING_DRAIN_TIMEOUT = float(getenv("polling_drain_timeout", 30))
+
+# готовые клавиатуры страниц: (prefix, версия списка, страница) -> InlineKeyboardMarkup
+keyboard_cache = TTLCache(maxsize=int(getenv("keyboard_cache_size", 2048)),
+                          ttl=float(getenv("keyboard_cache_ttl", 3600)) if PROCESS_CACHES else 0)
+
 
-users_db_state = {}
+class Workout(StatesGroup):
+    active = State()
 
 
 class Form(StatesGroup):
@@ -50,20 +84,37 @@ class Form(StatesGroup):
     note = State()
 
 
-def get_paginated_keyboard(data: list, current_page: int, total_pages: int, prefix: str) -> InlineKeyboardMarkup:
+def get_paginated_keyboard(data: list, current_page: int, total_pages: int, prefix: str,
+                           version: Optional[Hashable] = None) -> InlineKeyboardMarkup:
+    """
+    Keyboard for one page of `data`. With `version` (content version of `data`)
+    the built markup is cached and shared between calls.
+    """
+    if version is None:
+        return build_paginated_keyboard(data, current_page, total_pages, prefix)
+    key = (prefix, version, current_page)
+    keyboard = keyboard_cache.get(key)
+    if keyboard is None:
+        keyboard = build_paginated_keyboard(data, current_page, total_pages, prefix)
+        keyboard_cache.set(key, keyboard)
+    return keyboard
+
+
+def build_paginated_keyboard(data: list, current_page: int, total_pages: int, prefix: str) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
+    item_cb, page_cb = PAGINATED[prefix]
 
     start = current_page * ITEMS_PER_PAGE
     end = start + ITEMS_PER_PAGE
     for item in data[start:end]:
-        builder.button(text=item["name"][:29], callback_data=f"{prefix}item_{item['id']}")
+        builder.button(text=item["name"][:29], callback_data=item_cb(id=item["id"]))
     builder.adjust(2)
     # Добавляем кнопки пагинации
     navigation_buttons = []
     if current_page > 0:
-        navigation_buttons.append(InlineKeyboardButton(text="«", callback_data=f"{prefix}page_{current_page - 1}"))
+        navigation_buttons.append(InlineKeyboardButton(text="«", callback_data=page_cb(page=current_page - 1).pack()))
     if current_page < total_pages - 1:
-        navigation_buttons.append(InlineKeyboardButton(text="»", callback_data=f"{prefix}page_{current_page + 1}"))
+        navigation_buttons.append(InlineKeyboardButton(text="»", callback_data=page_cb(page=current_page + 1).pack()))
 
     if navigation_buttons:
         builder.row(*navigation_buttons)
@@ -71,180 +122,316 @@ def get_paginated_keyboard(data: list, current_page: int, total_pages: int, pref
     return builder.as_markup()
 
 
+def is_shown(message: Message, keyboard: InlineKeyboardMarkup) -> bool:
+    """
+    True if the message already shows this keyboard (repeated tap on a stale button).
+    """
+    return message.reply_markup == keyboard
+
+
+def get_history_text(ex_name: str, rows: list) -> str:
+    if rows:
+        hist_msg = "".join(f"{h.created_at.strftime('%d.%m.%Y')} | {h.note}\n" for h in rows)
+    else:
+        hist_msg = "Нет записей о прошлых занятиях.\n"
+    return f"Вы выбрали: \"{ex_name}\".\n{hist_msg}Далее ввод записи формата: 100(8)-90(7)"
+
+
+def get_history_keyboard(ex_id: int, cursor: Optional[int]) -> InlineKeyboardMarkup:
+    buttons = []
+    if cursor is not None:
+        buttons.append(InlineKeyboardButton(text="« Ранее", callback_data=ExHist(ex_id=ex_id, before=cursor).pack()))
+    buttons.append(InlineKeyboardButton(text="График", callback_data=ExChart(ex_id=ex_id).pack()))
+    buttons.append(InlineKeyboardButton(text="Стоп", callback_data=Stop().pack()))
+    return InlineKeyboardMarkup(inline_keyboard=[buttons])
+
+
+def split_message(lines: list[str], limit: int = MESSAGE_LIMIT) -> list[str]:
+    """
+    Joins lines into messages no longer than `limit` characters.
+    """
+    parts, current, size = [], [], 0
+    for line in lines:
+        line = line[:limit]
+        if current and size + len(line) + 1 > limit:
+            parts.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+async def concurrently(*calls: Awaitable) -> list:
+    """
+    asyncio.gather that also takes Bot API calls: method shortcuts (message.edit_text() etc.)
+    return awaitable objects, not coroutines, and gather cannot hash them.
+    """
+    async def run(call: Awaitable):
+        return await call
+
+    return await asyncio.gather(*(run(call) for call in calls))
+
+
+# раньше общего /start: меню упражнений заменило бы состояние тренировки вместе с записями
+@dp.message(Workout.active, CommandStart())
+async def workout_start_menu(message: Message, state: FSMContext) -> None:
+    entries = (await state.get_data()).get("workout", [])
+    await message.answer(f"Идет тренировка, записей: {len(entries)}.\n/finish - сохранить, /cancel - отменить")
+
+
 @dp.message(CommandStart())
 async def command_start_handler(message: Message, from_func: bool = False) -> None:
     """
     This handler receives messages with `/start` command
     """
 
-    user_id = message.from_user.id
-    user_name = message.from_user.username
-    async with async_session_maker() as session:
-        async with session.begin():
-            try:
+    try:
+        # from_func: сообщение бота (кнопка "Назад"), from_user у него - сам бот
+        if from_func:
+            version, bps_dict = await load_start_menu()
+        else:
+            version, bps_dict = await load_start_menu(message.from_user.id, message.from_user.username)
+
+        total_pages = (len(bps_dict) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
 
-                result = await session.execute(select(User).where(User.user_id == user_id))
-                user_db = result.scalars().first()
-                if not user_db:
-                    user_db = User(user_id=user_id, user_name=user_name)
-                    session.add(user_db)
-                    await session.commit()
+        await message.answer(
+            "Что сегодня будем качать?",
+            reply_markup=get_paginated_keyboard(bps_dict, 0, total_pages, prefix="bp", version=version)
+        )
 
-                if not from_func:
-                    users_db_state[user_id] = user_db.id
-                bps = await session.execute(select(BodyPart))
+    except IntegrityError as e:
+        logger.error(f"IntegrityError: {e}")
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
 
-                bps_dict = [{"id": b.id, "name": b.name} for b in bps.scalars().all()]
 
-                total_pages = (len(bps_dict) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
+@dp.message(Command("workout"))
+async def workout_start(message: Message, state: FSMContext) -> None:
+    await state.set_state(Workout.active)
+    await state.set_data({"workout": []})
+    await message.answer("Тренировка начата. Присылайте записи, можно несколько строк сразу:\n"
+                         "Жим лежа: 100(8)-90(7)\nТяга: 120(5)-120(5)\n\n/finish - сохранить, /cancel - отменить")
 
-                await message.answer(
-                    "Что сегодня будем качать?",
-                    reply_markup=get_paginated_keyboard(bps_dict, 0, total_pages, prefix="bp")
-                )
 
-            except IntegrityError as e:
-                logger.error(f"IntegrityError: {e}")
-                await session.rollback()
-            except Exception as e:
-                logger.error(f"Unexpected error: {e}")
-                await session.rollback()
+@dp.message(Workout.active, Command("finish"))
+async def workout_finish(message: Message, state: FSMContext) -> None:
+    from db.workout import save_workout
+
+    entries = (await state.get_data()).get("workout", [])
+    if not entries:
+        await message.answer("В тренировке нет записей. /cancel - выйти")
+        return
+    user_id = await user_resolver.resolve(message.from_user.id, message.from_user.username)
+    saved = await save_workout(user_id, entries)
+    await state.clear()
+    lines = [f"Тренировка сохранена, записей: {saved}"]
+    lines += [f"{html.escape(e['exercise'])} | {e['note']}" for e in entries]
+    for part in split_message(lines):
+        await message.answer(part)
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("expage_"))
-async def handle_page_click_ex(callback: CallbackQuery, state: FSMContext):
-    # todo: сделать кеш на запрос в бд
+@dp.message(Workout.active, Command("cancel", "exit"))
+async def workout_cancel(message: Message, state: FSMContext) -> None:
+    await state.clear()
+    await message.answer(f"Тренировка отменена.\n/start \n/today_stat")
+
+
+# команды проходят к своим обработчикам
+@dp.message(Workout.active, F.text, ~F.text.startswith("/"))
+async def workout_add(message: Message, state: FSMContext) -> None:
+    from db.workout import NOTE_MAX_LENGTH, parse_workout, resolve_lines
+
+    lines, bad, too_long = parse_workout(message.text)
+    user_id = await user_resolver.resolve(message.from_user.id, message.from_user.username)
+    entries, unknown, ambiguous = await resolve_lines(user_id, lines)
+
+    workout = (await state.get_data()).get("workout", []) + entries
+    if entries:
+        await state.update_data(workout=workout)
+
+    msg = [f"+ {html.escape(e['exercise'])} | {e['note']}" for e in entries]
+    if unknown:
+        msg.append("Нет таких упражнений: " + ", ".join(html.escape(n) for n in unknown))
+    for name, candidates in ambiguous:
+        msg.append(f"Уточните \"{html.escape(name)}\": " + ", ".join(html.escape(c) for c in candidates))
+    if bad:
+        msg.append("Не понял строки (формат \"Жим: 100(8)-90(7)\"): " + "; ".join(html.escape(b) for b in bad))
+    if too_long:
+        msg.append(f"Запись длиннее {NOTE_MAX_LENGTH} символов, не добавлена: "
+                   + "; ".join(html.escape(t) for t in too_long))
+    msg.append(f"В тренировке записей: {len(workout)}. /finish - сохранить")
+    for part in split_message(msg):
+        await message.answer(part)
+
+
+@callback_router.register(ExPage)
+async def handle_page_click_ex(callback: CallbackQuery, callback_data: ExPage, state: FSMContext):
     bp_id = await state.get_value("bp_id")
-    async with async_session_maker() as session:
-        async with session.begin():
-            exs = await session.execute(
-                select(Exercise).where(and_(Exercise.user_id == users_db_state.get(callback.from_user.id),
-                                            Exercise.bp_id == bp_id))
-            )
-            exs_dict = [{"id": e.id, "name": e.name} for e in exs.scalars().all()]
+    if bp_id is None:
+        # старая кнопка после "Стоп": группа мышц уже не выбрана
+        await callback.answer("Кнопка устарела, начните заново: /start")
+        return
+    user_id = await user_resolver.resolve(callback.from_user.id, callback.from_user.username)
+    version = exercises_version(user_id, bp_id)
+    exs_dict = await get_exercises(user_id, bp_id)
 
-    current_page = int(callback.data.split("_", 1)[1])
+    current_page = callback_data.page
     total_pages = (len(exs_dict) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
 
-    keyboard = get_paginated_keyboard(exs_dict, current_page, total_pages, prefix="ex")
+    keyboard = get_paginated_keyboard(exs_dict, current_page, total_pages, prefix="ex", version=version)
+    if is_shown(callback.message, keyboard):
+        await callback.answer()
+        return
 
     await callback.message.edit_text(f"Выберите упражнение", reply_markup=keyboard)
 
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("bppage_"))
-async def handle_page_click(callback: CallbackQuery):
-    # todo: сделать кеш на запрос в бд
-    async with async_session_maker() as session:
-        async with session.begin():
-            bps = await session.execute(select(BodyPart))
-            bps_dict = [{"id": b.id, "name": b.name} for b in bps.scalars().all()]
+@callback_router.register(BpPage)
+async def handle_page_click(callback: CallbackQuery, callback_data: BpPage):
+    version = body_parts_version()
+    bps_dict = await get_body_parts()
 
-    current_page = int(callback.data.split("_", 1)[1])
+    current_page = callback_data.page
     total_pages = (len(bps_dict) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
 
-    keyboard = get_paginated_keyboard(bps_dict, current_page, total_pages, prefix="bp")
+    keyboard = get_paginated_keyboard(bps_dict, current_page, total_pages, prefix="bp", version=version)
+    if is_shown(callback.message, keyboard):
+        await callback.answer()
+        return
 
     await callback.message.edit_text(f"Что сегодня будем качать?", reply_markup=keyboard)
 
 
 # Обработка нажатий на элементы (часть тела)
-@dp.callback_query(lambda callback: callback.data.startswith("bpitem_"))
-async def handle_item_click(callback: CallbackQuery, state: FSMContext):
-
-    item_id = callback.data.split("_")[1]
-
-    async with async_session_maker() as session:
-        async with session.begin():
-            bp_name = await session.execute(select(BodyPart.name).where(BodyPart.id == item_id))
-
-    bp_name = bp_name.scalars().first()
-
-    await state.update_data(body_part=bp_name, bp_id=item_id)
-
-    await callback.message.edit_text(
-        f"Вы выбрали: {bp_name}",
-        reply_markup=InlineKeyboardMarkup(
-            inline_keyboard=[
-                [
-                    InlineKeyboardButton(text="Выбрать упражнение", callback_data="ex_choose"),
-                    InlineKeyboardButton(text="Создать упражнение", callback_data="ex_create"),
-                ],
-                [
-                    InlineKeyboardButton(text="Назад", callback_data="ex_back")
+@callback_router.register(BpItem)
+async def handle_item_click(callback: CallbackQuery, callback_data: BpItem, state: FSMContext):
+
+    item_id = callback_data.id
+    bp_name = await get_body_part_name(item_id)
+
+    # запись состояния и ответ телеграму друг от друга не зависят
+    await concurrently(
+        state.update_data(body_part=bp_name, bp_id=item_id),
+        callback.message.edit_text(
+            f"Вы выбрали: {bp_name}",
+            reply_markup=InlineKeyboardMarkup(
+                inline_keyboard=[
+                    [
+                        InlineKeyboardButton(text="Выбрать упражнение", callback_data=ExChoose().pack()),
+                        InlineKeyboardButton(text="Создать упражнение", callback_data=ExCreate().pack()),
+                    ],
+                    [
+                        InlineKeyboardButton(text="Назад", callback_data=ExBack().pack())
+                    ]
                 ]
-            ]
-        )
+            )
+        ),
     )
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("ex_choose"))
+@callback_router.register(ExChoose)
 async def handle_ex_choose(callback: CallbackQuery, state: FSMContext):
     bp_id = await state.get_value("bp_id")
-
-    async with async_session_maker() as session:
-        async with session.begin():
-            exs = await session.execute(
-                select(Exercise).where(and_(Exercise.user_id == users_db_state.get(callback.from_user.id),
-                                            Exercise.bp_id == bp_id))
-            )
-            exs_dict = [{"id": e.id, "name": e.name} for e in exs.scalars().all()]
+    if bp_id is None:
+        # старая кнопка после "Стоп": группа мышц уже не выбрана
+        await callback.answer("Кнопка устарела, начните заново: /start")
+        return
+    user_id = await user_resolver.resolve(callback.from_user.id, callback.from_user.username)
+    version = exercises_version(user_id, bp_id)
+    exs_dict = await get_exercises(user_id, bp_id)
 
     total_pages = (len(exs_dict) + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
 
-    keyboard = get_paginated_keyboard(exs_dict, 0, total_pages, "ex")
+    keyboard = get_paginated_keyboard(exs_dict, 0, total_pages, "ex", version=version)
     if not keyboard.inline_keyboard:
         await callback.message.edit_text("Нет ни одного созданного упражнения",
                                          reply_markup=InlineKeyboardMarkup(
                                              inline_keyboard=[
-                                                 [InlineKeyboardButton(text="Создать", callback_data="ex_create")]
+                                                 [InlineKeyboardButton(text="Создать", callback_data=ExCreate().pack())]
                                              ]))
     else:
         await callback.message.edit_text("Выберите упражнение", reply_markup=keyboard)
 
 
 # Обработка нажатий на элементы (упражнение)
-@dp.callback_query(lambda callback: callback.data.startswith("exitem_"))
-async def handle_item_click_ex(callback: CallbackQuery, state: FSMContext):
+@callback_router.register(ExItem)
+async def handle_item_click_ex(callback: CallbackQuery, callback_data: ExItem, state: FSMContext):
 
-    item_id = callback.data.split("_")[1]
+    item_id = callback_data.id
 
-    async with async_session_maker() as session:
-        async with session.begin():
-            ex_name = await session.execute(select(Exercise.name).where(Exercise.id == item_id))
-    ex_name = ex_name.scalars().first()
+    user_id = await user_resolver.resolve(callback.from_user.id, callback.from_user.username)
+    view = await load_exercise_view(user_id, item_id, await state.get_value("bp_id"))
+    if view is None:
+        await callback.answer("Упражнение не найдено")
+        return
 
-    await state.update_data(exercise=ex_name, ex_id=item_id)
-    await state.set_state(Form.note)
+    # из поиска упражнение может быть из другой части тела
+    await concurrently(
+        set_state_data(state, Form.note, exercise=view.name, ex_id=item_id, bp_id=view.bp_id),
+        callback.message.edit_text(get_history_text(view.name, view.history),
+                                   reply_markup=get_history_keyboard(item_id, view.cursor)),
+    )
 
-    async with async_session_maker() as session:
-        async with session.begin():
-            hist = await session.execute(
-                select(History).where(
-                    and_(History.user_id == users_db_state.get(callback.from_user.id),
-                         History.exercise_id == item_id)).
-                order_by(History.created_at.asc())
-            )
-            hist_dict = [{"time": e.created_at, "note": e.note} for e in hist.scalars().all()]
 
-    hist_dict = hist_dict[-10:]
-    if hist_dict:
-        hist_msg = "".join(f"{h['time'].strftime('%d.%m.%Y')} | {h['note']}\n" for h in hist_dict)
-    else:
-        hist_msg = "Нет записей о прошлых занятиях.\n"
-    await callback.message.edit_text(f"Вы выбрали: \"{ex_name}\".\n{hist_msg}Далее ввод записи формата: 100(8)-90(7)",
-                                     reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
-                                         text="Стоп", callback_data="stop")]]))
+# Обработка нажатий "Ранее" (старые записи истории)
+@callback_router.register(ExHist)
+async def handle_history_page(callback: CallbackQuery, callback_data: ExHist, state: FSMContext):
+    ex_id = callback_data.ex_id
+
+    user_id = await user_resolver.resolve(callback.from_user.id, callback.from_user.username)
+    rows, cursor = await get_history_page(user_id, ex_id, callback_data.before)
+    ex_name = await state.get_value("exercise")
+    await callback.message.edit_text(get_history_text(ex_name, rows),
+                                     reply_markup=get_history_keyboard(ex_id, cursor))
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("ex_back"))
+@callback_router.register(ExChart)
+async def handle_chart(callback: CallbackQuery, callback_data: ExChart):
+    from charts import chart_cache, render_in_pool
+
+    ex_id = callback_data.ex_id
+    user_id = await user_resolver.resolve(callback.from_user.id, callback.from_user.username)
+
+    last_id = await get_last_history_id(user_id, ex_id)
+    if last_id is None:
+        await callback.answer("Нет записей для графика")
+        return
+
+    # график не менялся - отправляем уже загруженный в телеграм файл
+    key = chart_cache.key(user_id, ex_id, last_id)
+    file_id = chart_cache.get_file_id(key)
+    if file_id:
+        await callback.message.answer_photo(file_id)
+        return
+
+    path = chart_cache.get_image(key)
+    if path is None:
+        points = await get_chart_points(user_id, ex_id)
+        if not points:
+            await callback.answer("Нет записей формата 100(8)-90(7)")
+            return
+        # не из состояния: после "Стоп" или сохранения там пусто или другое упражнение
+        ex_name = await get_exercise_name(user_id, ex_id)
+        path = chart_cache.put_image(key, await render_in_pool(ex_name or "", points))
+
+    msg = await callback.message.answer_photo(FSInputFile(path))
+    chart_cache.set_file_id(key, msg.photo[-1].file_id)
+
+
+@callback_router.register(ExBack)
 async def handle_ex_back(callback: CallbackQuery):
-    await callback.message.delete()
-    await command_start_handler(callback.message, from_func=True)
+    await concurrently(callback.message.delete(), command_start_handler(callback.message, from_func=True))
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("ex_create"))
+@callback_router.register(ExCreate)
 async def handle_ex_create(callback: CallbackQuery, state: FSMContext):
+    if await state.get_value("bp_id") is None:
+        # старая кнопка после "Стоп": группа мышц уже не выбрана
+        await callback.answer("Кнопка устарела, начните заново: /start")
+        return
     await state.set_state(Form.exercise)
     await callback.message.edit_text(f"{callback.message.text}\nВведите название упражнения")
 
@@ -255,17 +442,22 @@ async def process_exercise(message: Message, state: FSMContext) -> None:
         await exit_command(message, state)
         return
     data = await state.update_data(exercise=message.text)
-    user_id = users_db_state.get(message.from_user.id)
-    async with async_session_maker() as session:
-        async with session.begin():
-            exercise = Exercise(user_id=user_id, bp_id=data.get("bp_id"), name=data.get("exercise"))
-            session.add(exercise)
-            await session.commit()
-            await state.update_data(ex_id=exercise.id)
+    if data.get("bp_id") is None:
+        await state.clear()
+        await message.answer(f"Кнопка устарела, начните заново: /start")
+        return
+    user_id = await user_resolver.resolve(message.from_user.id, message.from_user.username)
+    exercise = await writer.add(Exercise(user_id=user_id, bp_id=int(data.get("bp_id")), name=data.get("exercise")),
+                                wait=True)
+    await state.update_data(ex_id=exercise.id)
+    invalidate_exercises(user_id, data.get("bp_id"))
+    # модуль поиска не загружен - индексов нет, упражнение попадет в индекс при его загрузке
+    if "db.search" in sys.modules:
+        sys.modules["db.search"].exercise_search.add(user_id, exercise.id, int(data.get("bp_id")), exercise.name)
     await state.set_state(Form.note)
     await message.answer(f"Упражнение \"{message.text}\" сохранено.\nДалее ввод записи формата: 100(8)-90(7)",
                          reply_markup=InlineKeyboardMarkup(inline_keyboard=[[InlineKeyboardButton(
-                             text="Стоп", callback_data="stop")]]))
+                             text="Стоп", callback_data=Stop().pack())]]))
 
 
 @dp.message(Form.note)
@@ -278,93 +470,130 @@ async def process_exercise(message: Message, state: FSMContext) -> None:
                          reply_markup=
                          InlineKeyboardMarkup(inline_keyboard=[
                              [
-                                 InlineKeyboardButton(text="Да", callback_data="save_1"),
-                                 InlineKeyboardButton(text="Нет", callback_data="save_0"),
+                                 InlineKeyboardButton(text="Да", callback_data=Save(flag=1).pack()),
+                                 InlineKeyboardButton(text="Нет", callback_data=Save(flag=0).pack()),
                              ]
                          ]))
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("save"))
-async def handle_save_hist(callback: CallbackQuery, state: FSMContext):
-    flag = callback.data.split("_")[1]
-    if flag == "1":
-        data = await state.get_data()
-        user_id = users_db_state.get(callback.from_user.id)
-        async with async_session_maker() as session:
-            async with session.begin():
-                hist = History(
-                    user_id=int(user_id),
-                    bp_id=int(data.get("bp_id", 0)),
-                    exercise_id=int(data.get("ex_id", 0)),
-                    note=data.get("note", "")
-                )
-                session.add(hist)
-                await session.commit()
+@callback_router.register(Save)
+async def handle_save_hist(callback: CallbackQuery, callback_data: Save, state: FSMContext):
+    if callback_data.flag == 1:
+        user_id = await user_resolver.resolve(callback.from_user.id, callback.from_user.username)
+        # повторное нажатие (в том числе на другом воркере) уже ничего не находит
+        if not await save_note(state, Form.note, user_id):
+            await callback.answer("Запись уже сохранена")
+            return
         await callback.message.edit_text(f"Запись сохранена!")
-        await state.clear()
-        del users_db_state[callback.from_user.id]
     else:
         await callback.message.edit_text(f"Введите запись о упражнении:")
         await state.set_state(Form.note)
 
 
-@dp.callback_query(lambda callback: callback.data.startswith("stop"))
+@callback_router.register(Stop)
 async def handle_stop(callback: CallbackQuery, state: FSMContext):
-    await state.clear()
-    if users_db_state.get(callback.from_user.id):
-        del users_db_state[callback.from_user.id]
     msg = callback.message.text.split("\n")[:-1]
     msg = "\n".join(msg)
-    await callback.message.edit_text(f"{msg}\n/start \n/today_stat")
+    await concurrently(clear_state(state), callback.message.edit_text(f"{msg}\n/start \n/today_stat"))
 
 
 @dp.message(Command("exit"))
 async def exit_command(message: Message, state: FSMContext) -> None:
     await state.clear()
-    if users_db_state.get(message.from_user.id):
-        del users_db_state[message.from_user.id]
     await message.answer(f"Завершено.\n /start \n/today_stat")
 
 
+async def send_stat(message: Message, since: datetime, until: Optional[datetime], empty_msg: str,
+                    with_date: bool = False) -> None:
+    user_id = await user_resolver.resolve(message.from_user.id, create=False)
+    if user_id is None:
+        await message.answer(f"У вас нет записей.")
+        return
+
+    lines = []
+    bp = None
+    c = 1
+    async for row in iter_stat_rows(user_id, since, until):
+        if row.bp != bp:
+            if bp is not None:
+                lines.append("")
+            bp = row.bp
+            lines.append(f"<b>{html.escape(bp)}</b> ")
+        date = f"{row.created_at.strftime('%d.%m')} " if with_date else ""
+        lines.append(f"{c}. {date}{html.escape(row.exercise)} | {html.escape(row.note)} ")
+        c += 1
+
+    if not lines:
+        await message.answer(empty_msg)
+        return
+    for part in split_message(lines):
+        await message.answer(part)
+
+
 @dp.message(Command("today_stat"))
 async def exit_command(message: Message) -> None:
-    async with async_session_maker() as session:
-        async with session.begin():
-            result = await session.execute(select(User).where(User.user_id == message.from_user.id))
-            user_db = result.scalars().first()
-            if not user_db:
-                await message.answer(f"У вас нет записей.")
-                return
-
-            hist = await session.execute(
-                select(History).where(History.user_id == user_db.id).
-                options(joinedload(History.body_part), joinedload(History.exercise)).
-                filter(History.created_at >= datetime.combine(datetime.today(), time.min))
-            )
+    await send_stat(message, datetime.combine(datetime.today(), time.min), None, f"У вас нет записей за сегодня.")
+
 
-            hist_dict = [
-                {"bp": e.body_part.name, "exercise": e.exercise.name, "note": e.note}
-                for e in hist.scalars().all()
-            ]
+@dp.message(Command("week_stat"))
+async def week_stat_command(message: Message) -> None:
+    since = datetime.combine(datetime.today() - timedelta(days=6), time.min)
+    await send_stat(message, since, None, f"У вас нет записей за неделю.", with_date=True)
 
-            if not hist_dict:
-                await message.answer(f"У вас нет записей за сегодня.")
-                return
 
-            grouped = defaultdict(list)
-            for item in hist_dict:
-                grouped[item["bp"]].append(item)
-            grouped = dict(grouped)
-            msg = ""
-            c = 1
-            for bp in grouped:
-                msg += f"<b>{bp}</b> \n"
-                for ex in grouped[bp]:
-                    msg += f"{c}. {ex['exercise']} | {ex['note']} \n"
-                    c += 1
-                msg += "\n"
+@dp.message(Command("stat"))
+async def stat_command(message: Message) -> None:
+    args = message.text.split()[1:]
+    try:
+        since, until = (datetime.strptime(a, "%d.%m.%Y") for a in args)
+    except ValueError:
+        await message.answer(f"Формат: /stat 01.10.2024 31.10.2024")
+        return
+    await send_stat(message, since, until + timedelta(days=1), f"У вас нет записей за этот период.", with_date=True)
+
+
+@dp.message(Command("find"))
+async def find_handler(message: Message) -> None:
+    from db.search import exercise_search
+
+    query = message.text.partition(" ")[2].strip()
+    if not query:
+        await message.answer(f"Формат: /find жим")
+        return
+    user_id = await user_resolver.resolve(message.from_user.id, create=False)
+    found = await exercise_search.search(user_id, query) if user_id is not None else []
+    if not found:
+        await message.answer(f"Ничего не найдено.")
+        return
+    builder = InlineKeyboardBuilder()
+    for ex in found:
+        builder.button(text=ex.name[:29], callback_data=ExItem(id=ex.id))
+    builder.adjust(1)
+    await message.answer("Выберите упражнение", reply_markup=builder.as_markup())
+
+
+@dp.message(Command("progress"))
+async def progress_handler(message: Message) -> None:
+    user_id = await user_resolver.resolve(message.from_user.id, create=False)
+    rows = await get_progress(user_id) if user_id is not None else []
+    if not rows:
+        await message.answer(f"Нет записей за последние {PROGRESS_WEEKS} недель.")
+        return
 
-    await message.answer(f"{msg}")
+    # одно название может быть у упражнений разных частей тела
+    grouped = defaultdict(list)
+    for row in rows:
+        grouped[row.exercise_id].append(row)
+    lines = []
+    for weeks in grouped.values():
+        if lines:
+            lines.append("")
+        lines.append(f"<b>{html.escape(weeks[0].name)}</b>")
+        for w in weeks:
+            lines.append(f"{w.week_start.strftime('%d.%m')} | макс {w.max_weight:g} | объем {w.volume:g} "
+                         f"| 1ПМ {w.best_e1rm:.1f}")
+    for part in split_message(lines):
+        await message.answer(part)
 
 
 @dp.message(Command("dump"))
@@ -374,14 +603,55 @@ async def echo_handler(message: Message) -> None:
         return
     pass_phrase = message.text.split(" ")[1]
     if pass_phrase == dump_key:
-        if os.path.exists("data2.db"):
-            await message.answer_document(FSInputFile(path="data2.db"), caption="derji")
-        else:
+        from db.backup import backup
+
+        try:
+            path = await backup()
+        except Exception as e:
+            logger.error(f"backup failed: {e}")
             await message.answer(f"я в ахуе если често...")
+            return
+        await message.answer_document(FSInputFile(path=path), caption="derji")
     else:
         await message.answer(f"боже куда мы лезем...")
 
 
+@dp.message(Command("export"))
+async def export_handler(message: Message) -> None:
+    from db.export import EXPORT_FORMATS, ExportFile
+
+    fmt = (message.text.split()[1:2] or ["csv"])[0].lower()
+    if fmt not in EXPORT_FORMATS:
+        await message.answer(f"Формат: /export csv или /export jsonl")
+        return
+    user_id = await user_resolver.resolve(message.from_user.id, create=False)
+    if user_id is None:
+        await message.answer(f"У вас нет записей.")
+        return
+    await message.answer_document(ExportFile(user_id, fmt), caption="История занятий")
+
+
+@dp.message(Command("cache_stat"))
+async def cache_stat_handler(message: Message) -> None:
+    if message.text.split(" ")[1:2] != [dump_key]:
+        await message.answer(f"боже куда мы лезем...")
+        return
+    stats = {**lists_cache.stats(), **{f"keyboards_{k}": v for k, v in keyboard_cache.stats().items()},
+             **{f"callbacks_{k}": v for k, v in throttle.stats.items()},
+             **{f"archive_{name}_{k}": v for name, cache in archive_reader.stats().items() for k, v in cache.items()}}
+    await message.answer("\n".join(f"{k}: {v}" for k, v in stats.items()))
+
+
+@dp.message(Command("metrics"))
+async def metrics_handler(message: Message) -> None:
+    if message.text.split(" ")[1:2] != [dump_key]:
+        await message.answer(f"боже куда мы лезем...")
+        return
+    lines = [html.escape(line) for line in registry.summary()] or ["Пока пусто."]
+    for part in split_message(lines):
+        await message.answer(part)
+
+
 @dp.message(Command("body"))
 async def echo_handler(message: Message) -> None:
     try:
@@ -390,12 +660,92 @@ async def echo_handler(message: Message) -> None:
         await message.answer("Nice try!")
 
 
-async def main() -> None:
+async def drain_updates(timeout: float = POLLING_DRAIN_TIMEOUT) -> None:
+    """
+    Waits for updates that polling handed to handler tasks before it stopped
+    (webhook mode drains them in webhook.DrainingRequestHandler).
+    """
+    pending = set(dp._handle_update_tasks)
+    if pending:
+        logger.info(f"polling: draining {len(pending)} in-flight updates")
+        done, not_done = await asyncio.wait(pending, timeout=timeout)
+        if not_done:
+            logger.error(f"polling: {len(not_done)} updates not finished in {timeout}s")
+
+
+@dp.startup()
+async def on_startup() -> None:
+    fsm_storage.start_gc(float(getenv("fsm_gc_interval", 3600)))
+    startup_timer.mark("dispatcher")
+    startup_timer.report()
+
+
+async def main(mode: str = "polling") -> None:
     bot = Bot(token=TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
-    command.upgrade(alembic_cfg, "head")
-    logger.info("bot started")
-    await dp.start_polling(bot)
+    bot.session.middleware(RequestMetricsMiddleware())
+    if getenv("write_behind") == "1":
+        await writer.start()
+    scheduler = None
+    if getenv("scheduler") == "1":
+        # с несколькими webhook-воркерами каждый разослал бы дайджест заново
+        if mode == "webhook" and int(getenv("webhook_workers", 1)) > 1:
+            logger.warning("scheduler is disabled with several webhook workers, run it in a polling process")
+        else:
+            from notifications import build_scheduler
+
+            scheduler = build_scheduler(bot)
+            if ARCHIVE_AFTER_DAYS > 0:
+                scheduler.daily(time(int(getenv("archive_hour", 4))), archive_old_history, name="history archive")
+            scheduler.start()
+    metrics_runner = None
+    if mode == "polling" and getenv("metrics_port"):
+        metrics_runner = await serve_metrics(getenv("metrics_host", "127.0.0.1"), int(getenv("metrics_port")))
+    startup_timer.mark("bot")
+    logger.info(f"bot started ({mode})")
+    try:
+        if mode == "webhook":
+            import webhook
+
+            await webhook.serve(dp, bot, reuse_port=webhook.WEBHOOK_WORKERS > 1)
+        else:
+            await bot.delete_webhook()
+            await dp.start_polling(bot)
+    finally:
+        # polling/webhook останавливаются по SIGINT/SIGTERM, дописываем очередь до выхода:
+        # сначала обработчики, которые еще могут в нее положить
+        if mode != "webhook":
+            await drain_updates()
+        if scheduler is not None:
+            await scheduler.stop()
+        await writer.stop()
+        # пул рендера графиков есть, только если график уже строился
+        if "charts" in sys.modules:
+            sys.modules["charts"].shutdown_pool()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+
+
+def run_webhook_worker() -> None:
+    asyncio.run(main("webhook"))
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=("polling", "webhook"), default="polling")
+    # skip: миграции накатываются отдельно (python migrate.py), на старте даже не проверяются
+    parser.add_argument("--migrate", choices=("auto", "skip"), default=getenv("migrate_on_start", "auto"))
+    args = parser.parse_args()
+
+    if args.migrate == "auto":
+        import migrate
+
+        migrate.ensure_up_to_date()
+        startup_timer.mark("migrations")
+    if args.mode == "webhook":
+        import webhook
+
+        if webhook.WEBHOOK_URL:
+            asyncio.run(webhook.set_webhook(Bot(token=TOKEN)))
+        webhook.run_workers(run_webhook_worker)
+    else:
+        asyncio.run(main())
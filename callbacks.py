@@ -0,0 +1,101 @@
+import inspect
+from typing import Any, Awaitable, Callable, Dict, Optional, Type
+
+from aiogram.filters.callback_data import CallbackData
+from aiogram.types import CallbackQuery
+from loguru import logger
+
+
+class BpPage(CallbackData, prefix="bpp"):
+    page: int
+
+
+class BpItem(CallbackData, prefix="bpi"):
+    id: int
+
+
+class ExPage(CallbackData, prefix="exp"):
+    page: int
+
+
+class ExItem(CallbackData, prefix="exi"):
+    id: int
+
+
+class ExHist(CallbackData, prefix="exh"):
+    ex_id: int
+    before: int
+
+
+class ExChart(CallbackData, prefix="exc"):
+    ex_id: int
+
+
+class ExChoose(CallbackData, prefix="exch"):
+    pass
+
+
+class ExCreate(CallbackData, prefix="excr"):
+    pass
+
+
+class ExBack(CallbackData, prefix="exbk"):
+    pass
+
+
+class Save(CallbackData, prefix="sv"):
+    flag: int
+
+
+class Stop(CallbackData, prefix="stop"):
+    pass
+
+
+# клавиатуры get_paginated_keyboard: prefix -> (элемент, страница)
+PAGINATED = {
+    "bp": (BpItem, BpPage),
+    "ex": (ExItem, ExPage),
+}
+
+Handler = Callable[..., Awaitable[Any]]
+
+
+class CallbackRouter:
+    """
+    Routes callback queries by the packed prefix in one dict lookup instead of
+    evaluating a filter per handler; callback_data is unpacked once and passed to the handler.
+    """
+
+    def __init__(self):
+        self._routes: Dict[str, tuple[Type[CallbackData], Handler, frozenset]] = {}
+
+    def register(self, callback_data: Type[CallbackData]) -> Callable[[Handler], Handler]:
+        def decorator(handler: Handler) -> Handler:
+            prefix = callback_data.__prefix__
+            if prefix in self._routes:
+                raise ValueError(f"callback prefix {prefix!r} is already registered")
+            params = inspect.signature(handler).parameters
+            self._routes[prefix] = (callback_data, handler, frozenset(params))
+            return handler
+
+        return decorator
+
+    def handler_name(self, prefix: str) -> Optional[str]:
+        route = self._routes.get(prefix)
+        return route[1].__name__ if route else None
+
+    async def dispatch(self, callback: CallbackQuery, **data: Any) -> Any:
+        prefix = (callback.data or "").partition(":")[0]
+        route = self._routes.get(prefix)
+        if route is None:
+            # кнопка из старой версии бота
+            await callback.answer("Кнопка устарела, начните заново: /start")
+            return None
+        callback_data, handler, params = route
+        try:
+            data["callback_data"] = callback_data.unpack(callback.data)
+        except (TypeError, ValueError) as e:
+            logger.error(f"bad callback data {callback.data!r}: {e}")
+            await callback.answer()
+            return None
+        return await handler(callback, **{k: v for k, v in data.items() if k in params})
@@ -0,0 +1,134 @@
+import asyncio
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from os import getenv
+from typing import Optional
+
+from dotenv import load_dotenv
+
+from db.cache import TTLCache
+
+load_dotenv()
+
+CHARTS_DIR = getenv("charts_dir", "charts")
+CHARTS_WORKERS = int(getenv("charts_workers", 2))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def render_chart(title: str, points: list[tuple[datetime, float, float]]) -> bytes:
+    """
+    Renders max weight and volume per workout into PNG. Runs in a worker process.
+    """
+    import io
+
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    from matplotlib.dates import DateFormatter
+
+    dates = [p[0] for p in points]
+    fig, ax_weight = plt.subplots(figsize=(8, 4.5), dpi=100)
+    ax_weight.plot(dates, [p[1] for p in points], color="tab:red", marker="o", markersize=3)
+    ax_weight.set_ylabel("макс. вес", color="tab:red")
+    ax_volume = ax_weight.twinx()
+    ax_volume.bar(dates, [p[2] for p in points], color="tab:blue", alpha=0.3, width=1)
+    ax_volume.set_ylabel("объем", color="tab:blue")
+    ax_weight.xaxis.set_major_formatter(DateFormatter("%d.%m.%y"))
+    ax_weight.set_title(title)
+    fig.autofmt_xdate()
+    fig.tight_layout()
+
+    buf = io.BytesIO()
+    fig.savefig(buf, format="png")
+    plt.close(fig)
+    return buf.getvalue()
+
+
+class ChartCache:
+    """
+    PNG cache on disk, one chart per (user, exercise): the key changes with every new history entry,
+    so a cached chart is never stale, and storing a chart removes the outdated one.
+    Telegram file_id is stored next to the image and kept in a bounded in-memory cache.
+    """
+
+    def __init__(self, directory: str = CHARTS_DIR, maxsize: int = 1024, ttl: float = 86400):
+        self.directory = directory
+        self._file_ids = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def key(user_id: int, exercise_id: int, last_history_id: int) -> str:
+        return f"{user_id}/{exercise_id}/{last_history_id}"
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.png")
+
+    def get_file_id(self, key: str) -> Optional[str]:
+        file_id = self._file_ids.get(key)
+        if file_id is None:
+            try:
+                with open(f"{self.path(key)}.id") as f:
+                    file_id = f.read().strip()
+            except FileNotFoundError:
+                return None
+            self._file_ids.set(key, file_id)
+        return file_id
+
+    def set_file_id(self, key: str, file_id: str) -> None:
+        self._file_ids.set(key, file_id)
+        with open(f"{self.path(key)}.id", "w") as f:
+            f.write(file_id)
+
+    def get_image(self, key: str) -> Optional[str]:
+        path = self.path(key)
+        return path if os.path.exists(path) else None
+
+    def put_image(self, key: str, png: bytes) -> str:
+        path = self.path(key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(png)
+        os.replace(tmp, path)
+        self._remove_outdated(directory, os.path.basename(path))
+        return path
+
+    def _remove_outdated(self, directory: str, current: str) -> None:
+        """
+        Removes charts of the same (user, exercise) built for older history entries.
+        """
+        prefix = os.path.relpath(directory, self.directory).replace(os.sep, "/")
+        for name in os.listdir(directory):
+            if name.startswith(current) or name.endswith(".tmp"):
+                continue
+            self._file_ids.invalidate(f"{prefix}/{name.split('.', 1)[0]}")
+            try:
+                os.remove(os.path.join(directory, name))
+            except FileNotFoundError:
+                # удалил другой воркер
+                pass
+
+
+chart_cache = ChartCache(
+    maxsize=int(getenv("charts_cache_size", 1024)),
+    ttl=float(getenv("charts_cache_ttl", 86400)),
+)
+
+
+async def render_in_pool(title: str, points: list) -> bytes:
+    global _pool
+    if _pool is None:
+        # не fork: в процессе уже работают потоки (aiosqlite, executor), копия чужой захваченной
+        # блокировки в дочернем процессе никогда не освободится
+        _pool = ProcessPoolExecutor(max_workers=CHARTS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return await asyncio.get_running_loop().run_in_executor(_pool, render_chart, title, points)
+
+
+def shutdown_pool() -> None:
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,321 @@
+"""
+Archive of old history. Whole years older than `archive_after_days` are moved out of history and
+history_set into one compressed block per user and year (history_archive). history_archive_summary
+keeps per-exercise counts in the hot tables, so readers open only the blocks they need, and
+exercise_weekly_stats is not touched - its rows keep covering archived weeks.
+
+Readers (db.queries, db.export) union hot and archived rows. Archived entries are always older
+than hot ones, so the archive is read only after the hot rows are exhausted.
+
+    python -m db.archive              # archive history older than archive_after_days
+    python -m db.archive --days 730
+"""
+import argparse
+import asyncio
+import json
+import time
+import zlib
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from os import getenv
+from typing import NamedTuple, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import and_, delete, func, insert, update
+from sqlalchemy.future import select
+
+from db.cache import TTLCache
+from db.connect import async_session_maker
+from db.models import History, HistoryArchive, HistoryArchiveSummary, HistorySet
+
+load_dotenv()
+
+ARCHIVE_AFTER_DAYS = int(getenv("archive_after_days", 365))
+
+
+class ArchivedEntry(NamedTuple):
+    id: int
+    created_at: datetime
+    bp_id: int
+    exercise_id: int
+    note: str
+
+
+class ArchivedSet(NamedTuple):
+    history_id: int
+    set_index: int
+    weight: float
+    reps: int
+
+
+class SummaryRow(NamedTuple):
+    year: int
+    entries: int
+    last_id: int
+
+
+@dataclass
+class ArchiveBlock:
+    # по (created_at, id)
+    entries: list[ArchivedEntry]
+    sets: list[ArchivedSet]
+
+    def encode(self) -> bytes:
+        columns = {
+            "id": [e.id for e in self.entries],
+            "created_at": [e.created_at.isoformat(sep=" ") for e in self.entries],
+            "bp_id": [e.bp_id for e in self.entries],
+            "exercise_id": [e.exercise_id for e in self.entries],
+            "note": [e.note for e in self.entries],
+            "sets": {field: [getattr(s, field) for s in self.sets] for field in ArchivedSet._fields},
+        }
+        return zlib.compress(json.dumps(columns, ensure_ascii=False, separators=(",", ":")).encode(), 9)
+
+    @classmethod
+    def decode(cls, data: bytes) -> "ArchiveBlock":
+        columns = json.loads(zlib.decompress(data))
+        entries = [
+            ArchivedEntry(id_, datetime.fromisoformat(created_at), bp_id, exercise_id, note)
+            for id_, created_at, bp_id, exercise_id, note in zip(
+                columns["id"], columns["created_at"], columns["bp_id"], columns["exercise_id"], columns["note"])
+        ]
+        sets = [ArchivedSet(*row) for row in zip(*(columns["sets"][field] for field in ArchivedSet._fields))]
+        return cls(entries, sets)
+
+    def merge(self, other: "ArchiveBlock") -> "ArchiveBlock":
+        entries = {e.id: e for e in self.entries + other.entries}
+        sets = {(s.history_id, s.set_index): s for s in self.sets + other.sets}
+        return ArchiveBlock(sorted(entries.values(), key=lambda e: (e.created_at, e.id)),
+                            sorted(sets.values()))
+
+    def sets_by_entry(self) -> dict[int, list[ArchivedSet]]:
+        result = defaultdict(list)
+        for s in self.sets:
+            result[s.history_id].append(s)
+        return result
+
+    def summary_rows(self, user_id: int, year: int) -> list[dict]:
+        summary = {}
+        for e in self.entries:
+            row = summary.setdefault(e.exercise_id, {"user_id": user_id, "exercise_id": e.exercise_id, "year": year,
+                                                     "entries": 0, "last_id": e.id, "last_at": e.created_at})
+            row["entries"] += 1
+            row["last_id"] = max(row["last_id"], e.id)
+            row["last_at"] = max(row["last_at"], e.created_at)
+        return list(summary.values())
+
+
+class ArchiveReader:
+    """
+    Read access to the archive. The per-user summary is read on every call (one indexed query),
+    so blocks written by an archiver in another process are seen at once. Decoded blocks are cached,
+    a cached block is used only while its size matches the summary: archiving only adds entries.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600.0):
+        self.blocks = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def summary(self, user_id: int) -> dict[int, list[SummaryRow]]:
+        """
+        exercise id -> archived years of the exercise, oldest first.
+        """
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(HistoryArchiveSummary.exercise_id, HistoryArchiveSummary.year,
+                       HistoryArchiveSummary.entries, HistoryArchiveSummary.last_id)
+                .where(HistoryArchiveSummary.user_id == user_id)
+                .order_by(HistoryArchiveSummary.exercise_id, HistoryArchiveSummary.year)
+            )).all()
+        summary = defaultdict(list)
+        for row in rows:
+            summary[row.exercise_id].append(SummaryRow(row.year, row.entries, row.last_id))
+        return dict(summary)
+
+    async def years(self, user_id: int, exercise_id: Optional[int] = None) -> dict[int, int]:
+        """
+        Archived years of the user (having entries of the exercise) -> entries in the year's block.
+        """
+        summary = await self.summary(user_id)
+        sizes = defaultdict(int)
+        for rows in summary.values():
+            for row in rows:
+                sizes[row.year] += row.entries
+        rows = summary.get(exercise_id, []) if exercise_id is not None else \
+            [row for rows in summary.values() for row in rows]
+        return {year: sizes[year] for year in sorted({row.year for row in rows})}
+
+    async def get_blocks(self, user_id: int, years: dict[int, int]) -> dict[int, ArchiveBlock]:
+        """
+        Blocks of the given years, `years` as returned by years().
+        """
+        blocks, missing = {}, []
+        for year, size in years.items():
+            block = self.blocks.get((user_id, year))
+            if block is None or len(block.entries) != size:
+                missing.append(year)
+            else:
+                blocks[year] = block
+        if missing:
+            # недостающие блоки одним запросом
+            async with async_session_maker() as session:
+                rows = (await session.execute(
+                    select(HistoryArchive.year, HistoryArchive.data)
+                    .where(and_(HistoryArchive.user_id == user_id, HistoryArchive.year.in_(missing)))
+                )).all()
+            for row in rows:
+                blocks[row.year] = ArchiveBlock.decode(row.data)
+                self.blocks.set((user_id, row.year), blocks[row.year])
+        return dict(sorted(blocks.items()))
+
+    async def entries(self, user_id: int, exercise_id: Optional[int] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> list[ArchivedEntry]:
+        """
+        Archived entries of the user (of one exercise, in [since, until)) ordered by (created_at, id).
+        """
+        years = {y: size for y, size in (await self.years(user_id, exercise_id)).items()
+                 if (since is None or y >= since.year) and (until is None or y <= until.year)}
+        if not years:
+            return []
+        result = []
+        for block in (await self.get_blocks(user_id, years)).values():
+            result.extend(
+                e for e in block.entries
+                if (exercise_id is None or e.exercise_id == exercise_id)
+                and (since is None or e.created_at >= since) and (until is None or e.created_at < until)
+            )
+        return result
+
+    async def last_id(self, user_id: int, exercise_id: int) -> Optional[int]:
+        rows = (await self.summary(user_id)).get(exercise_id)
+        return max(row.last_id for row in rows) if rows else None
+
+    def invalidate(self, user_id: int, year: int) -> None:
+        self.blocks.invalidate((user_id, year))
+
+    def clear(self) -> None:
+        self.blocks.clear()
+
+    def stats(self) -> dict:
+        return {"blocks": self.blocks.stats()}
+
+
+archive_reader = ArchiveReader(
+    maxsize=int(getenv("archive_cache_size", 1024)),
+    ttl=float(getenv("archive_cache_ttl", 3600)),
+)
+
+_lock = asyncio.Lock()
+
+
+def archive_cutoff(days: int = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None) -> datetime:
+    """
+    Start of the first year that stays hot: only whole years older than `days` are archived,
+    so a block is written once and not rewritten on every run.
+    """
+    return datetime(((now or datetime.now()) - timedelta(days=days)).year, 1, 1)
+
+
+def year_bounds(year: int, cutoff: datetime) -> tuple[datetime, datetime]:
+    """
+    Local-time [start, end) of a block year, never past `cutoff`.
+    """
+    return datetime(year, 1, 1), min(datetime(year + 1, 1, 1), cutoff)
+
+
+async def archive_user_year(user_id: int, year: int, cutoff: datetime) -> int:
+    """
+    Moves one year of the user's history into its archive block in one transaction,
+    returns the number of moved entries.
+    """
+    since, until = year_bounds(year, cutoff)
+    period = and_(History.user_id == user_id, History.created_at >= since, History.created_at < until)
+    async with async_session_maker() as session:
+        async with session.begin():
+            rows = (await session.execute(
+                select(History.id, History.created_at, History.bp_id, History.exercise_id, History.note)
+                .where(period)
+                .order_by(History.created_at, History.id)
+            )).all()
+            if not rows:
+                return 0
+            # удаляется ровно прочитанное: записи, добавленные после чтения, получат id больше
+            moved = and_(period, History.id <= max(r.id for r in rows))
+            moved_ids = select(History.id).where(moved)
+            sets = (await session.execute(
+                select(HistorySet.history_id, HistorySet.set_index, HistorySet.weight, HistorySet.reps)
+                .where(HistorySet.history_id.in_(moved_ids))
+                .order_by(HistorySet.history_id, HistorySet.set_index)
+            )).all()
+            block = ArchiveBlock([ArchivedEntry(*r) for r in rows], [ArchivedSet(*s) for s in sets])
+
+            existing = (await session.execute(
+                select(HistoryArchive.id, HistoryArchive.data)
+                .where(and_(HistoryArchive.user_id == user_id, HistoryArchive.year == year))
+            )).first()
+            if existing is not None:
+                block = ArchiveBlock.decode(existing.data).merge(block)
+            values = {"entries": len(block.entries), "first_at": block.entries[0].created_at,
+                      "last_at": block.entries[-1].created_at, "data": block.encode()}
+            if existing is not None:
+                await session.execute(update(HistoryArchive).where(HistoryArchive.id == existing.id).values(**values))
+            else:
+                await session.execute(insert(HistoryArchive).values(user_id=user_id, year=year, **values))
+
+            await session.execute(delete(HistoryArchiveSummary).where(
+                and_(HistoryArchiveSummary.user_id == user_id, HistoryArchiveSummary.year == year)))
+            await session.execute(insert(HistoryArchiveSummary), block.summary_rows(user_id, year))
+            await session.execute(delete(HistorySet).where(HistorySet.history_id.in_(moved_ids)))
+            await session.execute(delete(History).where(moved))
+    return len(rows)
+
+
+async def archive_old_history(days: int = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None) -> dict:
+    cutoff = archive_cutoff(days, now)
+    stats = {"blocks": 0, "entries": 0}
+    async with _lock:
+        started = time.perf_counter()
+        # годы блоков берутся по локальным границам, как в archive_user_year: extract("year") в SQLite
+        # дал бы год по UTC, и записи около полуночи 31 декабря попали бы не в тот блок
+        async with async_session_maker() as session:
+            firsts = (await session.execute(
+                select(History.user_id, func.min(History.created_at)).where(History.created_at < cutoff)
+                .group_by(History.user_id).order_by(History.user_id)
+            )).all()
+        for user_id, first_at in firsts:
+            for block_year in range(first_at.year, cutoff.year):
+                # пользователь-год за раз: память ограничена одним блоком
+                moved = await archive_user_year(user_id, block_year, cutoff)
+                archive_reader.invalidate(user_id, block_year)
+                if moved:
+                    stats["blocks"] += 1
+                    stats["entries"] += moved
+        logger.info(f"archive: {stats['entries']} entries before {cutoff:%Y-%m-%d} in {stats['blocks']} blocks, "
+                    f"{time.perf_counter() - started:.1f}s")
+    return stats
+
+
+async def archive_size() -> tuple[int, int, int]:
+    """
+    (blocks, entries, compressed bytes).
+    """
+    async with async_session_maker() as session:
+        row = (await session.execute(
+            select(func.count(HistoryArchive.id), func.coalesce(func.sum(HistoryArchive.entries), 0),
+                   func.coalesce(func.sum(func.length(HistoryArchive.data)), 0))
+        )).one()
+    return tuple(row)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS)
+    args = parser.parse_args()
+
+    async def main() -> None:
+        await archive_old_history(args.days)
+        blocks, entries, size = await archive_size()
+        logger.info(f"archive total: {blocks} blocks, {entries} entries, {size / 1024:.0f} KiB")
+
+    asyncio.run(main())
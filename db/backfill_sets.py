@@ -0,0 +1,59 @@
+"""
+One-shot backfill of history_set from existing history rows, exercise_weekly_stats
+is updated in the same transaction as each chunk.
+
+    python -m db.backfill_sets --chunk 5000
+"""
+import argparse
+import asyncio
+
+from loguru import logger
+from sqlalchemy import exists, insert
+from sqlalchemy.future import select
+
+from db.connect import async_session_maker
+from db.models import History, HistorySet
+from db.sets import parse_note
+from db.stats import set_row, upsert_weekly_stats
+
+
+async def backfill(chunk: int) -> None:
+    last_id = 0
+    processed = inserted = 0
+    while True:
+        async with async_session_maker() as session:
+            # курсор по id, в памяти только один чанк
+            rows = (await session.execute(
+                select(History.id, History.user_id, History.exercise_id, History.created_at, History.note)
+                .where(History.id > last_id)
+                .where(~exists().where(HistorySet.history_id == History.id))
+                .order_by(History.id)
+                .limit(chunk)
+            )).all()
+            if not rows:
+                break
+
+            values, stats = [], []
+            for r in rows:
+                for s in parse_note(r.note):
+                    values.append({"history_id": r.id, "user_id": r.user_id, "exercise_id": r.exercise_id,
+                                   "set_index": s.set_index, "weight": s.weight, "reps": s.reps})
+                    stats.append(set_row(r.user_id, r.exercise_id, r.created_at, s.weight, s.reps))
+            if values:
+                # Core insert мимо ORM: after_flush из db.stats не сработает, агрегаты обновляем сами
+                await session.execute(insert(HistorySet), values)
+                await session.run_sync(lambda sync_session: upsert_weekly_stats(sync_session.connection(), stats))
+            await session.commit()
+
+        last_id = rows[-1].id
+        processed += len(rows)
+        inserted += len(values)
+        logger.info(f"backfill: {processed} history rows, {inserted} sets")
+
+    logger.info(f"backfill done: {processed} history rows, {inserted} sets")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunk", type=int, default=5000)
+    asyncio.run(backfill(parser.parse_args().chunk))
@@ -0,0 +1,93 @@
+"""
+Consistent snapshots of the live SQLite database via the online backup API.
+
+    python -m db.backup --out backups/data.db
+"""
+import argparse
+import asyncio
+import gzip
+import os
+import shutil
+import sqlite3
+from contextlib import closing
+from datetime import datetime
+from os import getenv
+from typing import Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy.engine import make_url
+
+load_dotenv()
+
+BACKUP_DIR = getenv("backup_dir", "backups")
+BACKUP_KEEP = int(getenv("backup_keep", 3))
+
+_lock = asyncio.Lock()
+
+
+def sqlite_path(url: str) -> Optional[str]:
+    """
+    Database file of an sqlite url, None for other backends and in-memory databases.
+    """
+    url = make_url(url)
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database
+
+
+def _backup_sqlite(src: str, dest: str, compress: bool) -> None:
+    tmp = f"{dest}.tmp"
+    with closing(sqlite3.connect(src)) as source, closing(sqlite3.connect(tmp)) as target:
+        # одним шагом: пошаговая копия начинается заново после каждой записи другим соединением
+        # и под постоянной записью не заканчивается. В WAL (профиль по умолчанию) копия читает
+        # снимок и писателей не блокирует
+        source.backup(target, pages=-1)
+    if compress:
+        with open(tmp, "rb") as f_in, gzip.open(f"{tmp}.gz", "wb", compresslevel=6) as f_out:
+            shutil.copyfileobj(f_in, f_out, 1024 * 1024)
+        os.remove(tmp)
+        tmp = f"{tmp}.gz"
+    # неполный файл никогда не лежит под итоговым именем
+    os.replace(tmp, dest)
+
+
+def _rotate(directory: str, keep: int) -> None:
+    backups = sorted(
+        (os.path.join(directory, f) for f in os.listdir(directory) if f.endswith((".db", ".db.gz"))),
+        key=os.path.getmtime,
+    )
+    for path in backups[:-keep] if keep > 0 else []:
+        os.remove(path)
+
+
+async def backup(url: Optional[str] = None, dest: Optional[str] = None, compress: bool = True) -> str:
+    """
+    Copies the database to `dest` (by default a timestamped file in BACKUP_DIR) in a worker thread,
+    returns the path. Old backups in BACKUP_DIR beyond BACKUP_KEEP are removed.
+    """
+    src = sqlite_path(url or getenv("async_db_url"))
+    if src is None:
+        raise ValueError("online backup is supported for file sqlite databases only")
+
+    rotate = dest is None
+    if dest is None:
+        name = os.path.splitext(os.path.basename(src))[0]
+        dest = os.path.join(BACKUP_DIR, f"{name}-{datetime.now():%Y%m%d-%H%M%S}.db" + (".gz" if compress else ""))
+    os.makedirs(os.path.dirname(dest) or ".", exist_ok=True)
+
+    async with _lock:
+        started = datetime.now()
+        await asyncio.to_thread(_backup_sqlite, src, dest, compress)
+        if rotate:
+            await asyncio.to_thread(_rotate, BACKUP_DIR, BACKUP_KEEP)
+    logger.info(f"backup: {dest}, {os.path.getsize(dest)} bytes in {(datetime.now() - started).total_seconds():.1f}s")
+    return dest
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=None)
+    parser.add_argument("--no-compress", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(backup(dest=args.out, compress=not args.no_compress))
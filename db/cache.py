@@ -0,0 +1,158 @@
+import itertools
+import time
+from collections import OrderedDict
+from os import getenv
+from typing import Any, Hashable, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import and_
+from sqlalchemy.future import select
+
+from db.connect import async_session_maker
+from db.models import BodyPart, Exercise
+
+load_dotenv()
+
+_MISSING = object()
+
+# с несколькими webhook-воркерами запись в одном процессе не сбрасывает кэши остальных:
+# кэши, которые сбрасываются при записи, тогда выключены и все читается из базы
+PROCESS_CACHES = int(getenv("webhook_workers", 1)) <= 1
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with per-entry TTL and hit/miss counters. With `ttl <= 0` nothing is stored.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 600.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.ttl <= 0:
+            return
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# списки частей тела и упражнений пользователя для клавиатур
+lists_cache = TTLCache(
+    maxsize=int(getenv("cache_size", 1024)),
+    ttl=float(getenv("cache_ttl", 600)) if PROCESS_CACHES else 0,
+)
+
+# версии списков: новая версия после каждой записи, по ним кэшируются готовые клавиатуры.
+# Вытесненная версия тоже выдается заново, поэтому старая клавиатура не может вернуться
+# без PROCESS_CACHES каждый вызов получает новую версию
+_versions = TTLCache(maxsize=int(getenv("cache_size", 1024)) * 4, ttl=float("inf") if PROCESS_CACHES else 0)
+_version_seq = itertools.count(1)
+
+BODY_PARTS_KEY = ("bp",)
+
+
+def _exercises_key(user_id: int, bp_id: int) -> tuple:
+    return "ex", user_id, int(bp_id)
+
+
+def list_version(key: tuple) -> tuple:
+    """
+    Current content version of a cached list, as a hashable key.
+    """
+    version = _versions.get(key)
+    if version is None:
+        version = next(_version_seq)
+        _versions.set(key, version)
+    return *key, version
+
+
+def body_parts_version() -> tuple:
+    return list_version(BODY_PARTS_KEY)
+
+
+def exercises_version(user_id: int, bp_id: int) -> tuple:
+    return list_version(_exercises_key(user_id, bp_id))
+
+
+async def get_body_parts() -> list[dict]:
+    bps_dict = lists_cache.get(BODY_PARTS_KEY)
+    if bps_dict is not None:
+        return bps_dict
+    async with async_session_maker() as session:
+        bps = await session.execute(select(BodyPart.id, BodyPart.name).order_by(BodyPart.id))
+        bps_dict = [{"id": b.id, "name": b.name} for b in bps.all()]
+    lists_cache.set(BODY_PARTS_KEY, bps_dict)
+    return bps_dict
+
+
+async def get_exercises(user_id: int, bp_id: int) -> list[dict]:
+    key = _exercises_key(user_id, bp_id)
+    exs_dict = lists_cache.get(key)
+    if exs_dict is not None:
+        return exs_dict
+    async with async_session_maker() as session:
+        exs = await session.execute(
+            select(Exercise.id, Exercise.name).where(and_(Exercise.user_id == user_id,
+                                                          Exercise.bp_id == int(bp_id)))
+            .order_by(Exercise.id)
+        )
+        exs_dict = [{"id": e.id, "name": e.name} for e in exs.all()]
+    lists_cache.set(key, exs_dict)
+    return exs_dict
+
+
+def peek_exercises(user_id: int, bp_id: int) -> Optional[list[dict]]:
+    """
+    Cached exercise list without going to the database on a miss.
+    """
+    return lists_cache.get(_exercises_key(user_id, bp_id))
+
+
+def invalidate_exercises(user_id: int, bp_id: int) -> None:
+    key = _exercises_key(user_id, bp_id)
+    lists_cache.invalidate(key)
+    _versions.invalidate(key)
+
+
+def invalidate_body_parts() -> None:
+    lists_cache.invalidate(BODY_PARTS_KEY)
+    _versions.invalidate(BODY_PARTS_KEY)
@@ -1,10 +1,12 @@
 from os import getenv
 
 from dotenv import load_dotenv
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.engine import create_engine
 
 load_dotenv()
 
-# для отслеживания запросов echo=True
-engine_async = create_async_engine(getenv("async_db_url"), echo=False)
+# настройки движка (WAL, pragmas, пул) - db_* в .env, для отслеживания запросов db_echo=1
+engine_async = create_engine(getenv("async_db_url"))
 async_session_maker = async_sessionmaker(engine_async, class_=AsyncSession, expire_on_commit=False)
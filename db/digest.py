@@ -0,0 +1,108 @@
+"""
+Aggregates for scheduled notifications. Every function is one query per aggregate over all users,
+the result is grouped by telegram user id in Python.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, func
+from sqlalchemy.future import select
+
+from db.connect import async_session_maker
+from db.models import BodyPart, Exercise, ExerciseWeeklyStats, History, HistorySet, User
+
+
+@dataclass
+class Digest:
+    tg_id: int
+    sessions: int = 0
+    # часть тела -> (записей, объем)
+    body_parts: dict[str, tuple[int, float]] = field(default_factory=dict)
+    # упражнение -> новый максимальный вес
+    records: dict[str, float] = field(default_factory=dict)
+
+
+async def get_weekly_digests(week: date) -> dict[int, Digest]:
+    """
+    Digests for the week starting on `week` (monday) for every user who trained that week.
+    """
+    since = datetime.combine(week, datetime.min.time())
+    until = since + timedelta(days=7)
+    period = and_(History.created_at >= since, History.created_at < until)
+
+    per_set = (
+        select(HistorySet.history_id, func.sum(HistorySet.weight * HistorySet.reps).label("volume"))
+        .group_by(HistorySet.history_id)
+        .subquery()
+    )
+    by_body_part = (
+        select(User.user_id.label("tg_id"), BodyPart.name.label("bp"), func.count(History.id).label("entries"),
+               func.coalesce(func.sum(per_set.c.volume), 0).label("volume"))
+        .join(User, User.id == History.user_id)
+        .join(BodyPart, BodyPart.id == History.bp_id)
+        .outerjoin(per_set, per_set.c.history_id == History.id)
+        .where(period)
+        .group_by(User.user_id, BodyPart.id, BodyPart.name)
+        .order_by(User.user_id, BodyPart.id)
+    )
+    # дни тренировок считаются по локальной дате в Python, как недели в db.stats:
+    # date() в SQLite дал бы дату по UTC
+    entry_times = (
+        select(User.user_id.label("tg_id"), History.created_at)
+        .join(User, User.id == History.user_id)
+        .where(period)
+    )
+    previous = (
+        select(ExerciseWeeklyStats.user_id, ExerciseWeeklyStats.exercise_id,
+               func.max(ExerciseWeeklyStats.max_weight).label("max_weight"))
+        .where(ExerciseWeeklyStats.week_start < week)
+        .group_by(ExerciseWeeklyStats.user_id, ExerciseWeeklyStats.exercise_id)
+        .subquery()
+    )
+    records = (
+        select(User.user_id.label("tg_id"), Exercise.name, ExerciseWeeklyStats.max_weight)
+        .join(previous, and_(previous.c.user_id == ExerciseWeeklyStats.user_id,
+                             previous.c.exercise_id == ExerciseWeeklyStats.exercise_id))
+        .join(User, User.id == ExerciseWeeklyStats.user_id)
+        .join(Exercise, Exercise.id == ExerciseWeeklyStats.exercise_id)
+        .where(and_(ExerciseWeeklyStats.week_start == week, ExerciseWeeklyStats.max_weight > previous.c.max_weight))
+    )
+
+    digests: dict[int, Digest] = {}
+    async with async_session_maker() as session:
+        for row in await session.execute(by_body_part):
+            digest = digests.setdefault(row.tg_id, Digest(row.tg_id))
+            digest.body_parts[row.bp] = (row.entries, float(row.volume))
+        days = defaultdict(set)
+        for row in await session.execute(entry_times):
+            days[row.tg_id].add(row.created_at.date())
+        for tg_id, user_days in days.items():
+            digests.setdefault(tg_id, Digest(tg_id)).sessions = len(user_days)
+        for row in await session.execute(records):
+            if row.tg_id in digests:
+                digests[row.tg_id].records[row.name] = row.max_weight
+    return digests
+
+
+async def get_stale_body_parts(days: int, active_days: int = 60) -> dict[int, list[tuple[str, int]]]:
+    """
+    Body parts not trained for more than `days` days by users who trained in the last `active_days`:
+    telegram user id -> [(body part, days since last entry)].
+    """
+    now = datetime.now()
+    last = func.max(History.created_at).label("last")
+    query = (
+        select(User.user_id.label("tg_id"), BodyPart.name.label("bp"), last)
+        .join(User, User.id == History.user_id)
+        .join(BodyPart, BodyPart.id == History.bp_id)
+        .where(History.created_at >= now - timedelta(days=active_days))
+        .group_by(User.user_id, BodyPart.id, BodyPart.name)
+        .having(last < now - timedelta(days=days))
+        .order_by(User.user_id, last)
+    )
+    result = defaultdict(list)
+    async with async_session_maker() as session:
+        for row in await session.execute(query):
+            result[row.tg_id].append((row.bp, (now - row.last).days))
+    return dict(result)
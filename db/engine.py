@@ -0,0 +1,110 @@
+from dataclasses import dataclass, fields
+from os import getenv
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+load_dotenv()
+
+
+@dataclass
+class EngineProfile:
+    """
+    Engine settings: pragmas are applied to every new SQLite connection,
+    pool settings are used for both SQLite and Postgres, server settings - to Postgres sessions.
+    """
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    # отрицательное значение - размер в KiB
+    cache_size: int = -64 * 1024
+    busy_timeout: int = 5000
+    temp_store: str = "MEMORY"
+
+    pool_size: int = 5
+    max_overflow: int = 10
+    pool_timeout: float = 30
+    pool_recycle: int = 1800
+    echo: bool = False
+
+    # 0 - без ограничения
+    statement_timeout: int = 0
+    # пусто - часовой пояс сервера; влияет на date(created_at) в агрегатах по дням
+    timezone: str = ""
+
+    @classmethod
+    def from_env(cls) -> "EngineProfile":
+        """
+        Reads `db_<field>` variables (e.g. db_journal_mode=WAL, db_pool_size=10), missing ones keep defaults.
+        """
+        values = {}
+        for field in fields(cls):
+            raw = getenv(f"db_{field.name}")
+            if raw is None or raw == "":
+                continue
+            if field.type is bool:
+                values[field.name] = raw.lower() in ("1", "true", "yes")
+            elif field.type is int:
+                values[field.name] = int(raw)
+            elif field.type is float:
+                values[field.name] = float(raw)
+            else:
+                values[field.name] = raw
+        return cls(**values)
+
+    def sqlite_pragmas(self) -> list[str]:
+        return [
+            f"PRAGMA journal_mode={self.journal_mode}",
+            f"PRAGMA synchronous={self.synchronous}",
+            f"PRAGMA mmap_size={self.mmap_size}",
+            f"PRAGMA cache_size={self.cache_size}",
+            f"PRAGMA busy_timeout={self.busy_timeout}",
+            f"PRAGMA temp_store={self.temp_store}",
+        ]
+
+    def postgres_settings(self) -> dict[str, str]:
+        settings = {"application_name": "gym_bot"}
+        if self.statement_timeout:
+            settings["statement_timeout"] = str(self.statement_timeout)
+        if self.timezone:
+            settings["timezone"] = self.timezone
+        return settings
+
+
+def create_engine(url: str, profile: Optional[EngineProfile] = None) -> AsyncEngine:
+    profile = profile or EngineProfile.from_env()
+    backend = make_url(url).get_backend_name()
+
+    options = {
+        "echo": profile.echo,
+        "pool_size": profile.pool_size,
+        "max_overflow": profile.max_overflow,
+        "pool_timeout": profile.pool_timeout,
+        "pool_recycle": profile.pool_recycle,
+    }
+    if backend == "sqlite":
+        # по умолчанию aiosqlite открывает новое соединение (и поток) на каждую сессию
+        options["poolclass"] = AsyncAdaptedQueuePool
+    elif backend == "postgresql":
+        options["pool_pre_ping"] = True
+        # соединения уходят и возвращаются в пул чаще, чем простаивают - LIFO дает остывшим закрыться по recycle
+        options["pool_use_lifo"] = True
+        options["connect_args"] = {"server_settings": profile.postgres_settings()}
+
+    engine = create_async_engine(url, **options)
+
+    if backend == "sqlite":
+        pragmas = profile.sqlite_pragmas()
+
+        @event.listens_for(engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return engine
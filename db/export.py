@@ -0,0 +1,84 @@
+import asyncio
+import csv
+import io
+import json
+import zlib
+from typing import AsyncGenerator, AsyncIterator
+
+from aiogram.types import InputFile
+from sqlalchemy.future import select
+
+from db.archive import archive_reader
+from db.connect import async_session_maker
+from db.models import BodyPart, Exercise, History
+from db.queries import archived_stat_rows
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_COLUMNS = ("created_at", "body_part", "exercise", "note")
+# строк на один сжимаемый кусок
+EXPORT_CHUNK_ROWS = 2000
+
+
+def _format_rows(rows: list, fmt: str) -> bytes:
+    buffer = io.StringIO()
+    if fmt == "csv":
+        csv.writer(buffer).writerows(rows)
+    else:
+        for row in rows:
+            buffer.write(json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n")
+    return buffer.getvalue().encode()
+
+
+async def iter_history_export(user_id: int, fmt: str = "csv",
+                              chunk_rows: int = EXPORT_CHUNK_ROWS) -> AsyncIterator[bytes]:
+    """
+    Streams the user's history as gzip-compressed CSV or JSONL.
+    Rows come from a server-side cursor, only one chunk (or one archive block) is kept in memory;
+    formatting and compression of each chunk run in a worker thread.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # 31 - формат gzip
+    if fmt == "csv":
+        yield compressor.compress(_format_rows([EXPORT_COLUMNS], fmt))
+
+    query = (
+        select(History.created_at, BodyPart.name, Exercise.name, History.note)
+        .join(BodyPart, BodyPart.id == History.bp_id)
+        .join(Exercise, Exercise.id == History.exercise_id)
+        .where(History.user_id == user_id)
+        .order_by(History.id)
+        .execution_options(yield_per=chunk_rows)
+    )
+    async with async_session_maker() as session:
+        # архив старше горячих записей - сначала он, по блоку за раз
+        for year, size in (await archive_reader.years(user_id)).items():
+            for block in (await archive_reader.get_blocks(user_id, {year: size})).values():
+                rows = [(r.created_at.isoformat(sep=" "), r.bp, r.exercise, r.note)
+                        for r in await archived_stat_rows(session, block.entries)]
+                data = await asyncio.to_thread(lambda: compressor.compress(_format_rows(rows, fmt)))
+                if data:
+                    yield data
+
+        result = await session.stream(query)
+        async for partition in result.partitions():
+            rows = [(r[0].isoformat(sep=" "), r[1], r[2], r[3]) for r in partition]
+            data = await asyncio.to_thread(lambda: compressor.compress(_format_rows(rows, fmt)))
+            if data:
+                yield data
+    yield compressor.flush()
+
+
+class ExportFile(InputFile):
+    """
+    Upload whose content is produced by `iter_history_export` while it is being sent.
+    """
+
+    def __init__(self, user_id: int, fmt: str = "csv"):
+        super().__init__(filename=f"history.{fmt}.gz")
+        self.user_id = user_id
+        self.fmt = fmt
+
+    async def read(self, bot) -> AsyncGenerator[bytes, None]:
+        async for chunk in iter_history_export(self.user_id, self.fmt):
+            yield chunk
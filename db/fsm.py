@@ -0,0 +1,163 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+from os import getenv
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy import case, delete
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.future import select
+
+from db.cache import PROCESS_CACHES, TTLCache
+from db.connect import async_session_maker
+from db.models import FsmState
+
+load_dotenv()
+
+
+class SqlStorage(BaseStorage):
+    """
+    FSM storage in the fsm_state table with an optional write-through in-memory cache in front.
+    Entries not touched for `ttl` seconds are treated as empty and removed by `gc()`.
+
+    set_state and set_data write only their own column, so a write never carries the other one
+    over from an earlier read. The cache is per process: with several bot processes it must be
+    off (`cache_ttl=0`, forced for webhook_workers > 1), every read then goes to the database.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker = async_session_maker, ttl: float = 86400,
+                 cache_size: int = 4096, cache_ttl: float = 60, key_builder: Optional[KeyBuilder] = None):
+        self.session_maker = session_maker
+        self.ttl = ttl
+        self.cache = TTLCache(maxsize=cache_size, ttl=cache_ttl) if cache_ttl > 0 else None
+        self.key_builder = key_builder or DefaultKeyBuilder()
+        self._gc_task: Optional[asyncio.Task] = None
+
+    async def _load(self, key: str) -> tuple[Optional[str], Dict[str, Any]]:
+        record = self.cache.get(key) if self.cache is not None else None
+        if record is not None:
+            return record
+        async with self.session_maker() as session:
+            row = (await session.execute(
+                select(FsmState.state, FsmState.data)
+                .where(FsmState.key == key, FsmState.updated_at >= datetime.now() - timedelta(seconds=self.ttl))
+            )).first()
+        record = (row.state, json.loads(row.data)) if row else (None, {})
+        if self.cache is not None:
+            self.cache.set(key, record)
+        return record
+
+    async def _save(self, key: str, values: Dict[str, Any]) -> None:
+        """
+        Upserts the given columns ("state" and/or "data"). A column that is not given keeps its value,
+        unless the row has expired - then it is reset as `_load` would see it.
+        """
+        now = datetime.now()
+        async with self.session_maker() as session:
+            if values.get("state", "") is None and values.get("data") == {}:
+                await session.execute(delete(FsmState).where(FsmState.key == key))
+            else:
+                row = {"state": values.get("state"), "data": json.dumps(values.get("data", {}))}
+                insert = postgresql.insert if session.bind.dialect.name == "postgresql" else sqlite.insert
+                stmt = insert(FsmState).values(key=key, updated_at=now, **row)
+                expired = FsmState.updated_at < now - timedelta(seconds=self.ttl)
+                set_ = {"updated_at": stmt.excluded.updated_at}
+                for column, empty in (("state", None), ("data", "{}")):
+                    current = getattr(FsmState, column)
+                    set_[column] = getattr(stmt.excluded, column) if column in values \
+                        else case((expired, empty), else_=current)
+                await session.execute(stmt.on_conflict_do_update(index_elements=[FsmState.key], set_=set_))
+            await session.commit()
+
+        if self.cache is None:
+            return
+        cached = self.cache.get(key)
+        if len(values) == 2 or cached is not None:
+            state, data = cached or (None, {})
+            self.cache.set(key, (values.get("state", state), values.get("data", data)))
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._save(self.key_builder.build(key), {"state": state.state if isinstance(state, State) else state})
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(self.key_builder.build(key))
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self._save(self.key_builder.build(key), {"data": data.copy()})
+
+    async def set_state_and_data(self, key: StorageKey, state: StateType, data: Dict[str, Any]) -> None:
+        """
+        set_state + set_data in one write, FSMContext has no such call (see db.handler_data).
+        """
+        await self._save(self.key_builder.build(key),
+                         {"state": state.state if isinstance(state, State) else state, "data": data.copy()})
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(self.key_builder.build(key))
+        return data.copy()
+
+    async def claim(self, session: AsyncSession, key: StorageKey, state: StateType) -> Optional[Dict[str, Any]]:
+        """
+        Removes the entry if it is in `state` and returns its data, None if it is not (already claimed).
+        The delete runs in the caller's transaction: it is committed together with what the caller writes,
+        and of two concurrent claims only one gets the row. Call `forget(key)` after the commit.
+        """
+        row = (await session.execute(
+            delete(FsmState)
+            .where(FsmState.key == self.key_builder.build(key),
+                   FsmState.state == (state.state if isinstance(state, State) else state),
+                   FsmState.updated_at >= datetime.now() - timedelta(seconds=self.ttl))
+            .returning(FsmState.data)
+        )).first()
+        return json.loads(row.data) if row else None
+
+    def forget(self, key: StorageKey) -> None:
+        """
+        Drops the cached entry after the row was changed bypassing `_save` (see `claim`).
+        """
+        if self.cache is not None:
+            self.cache.invalidate(self.key_builder.build(key))
+
+    async def gc(self) -> int:
+        """
+        Removes expired states, returns the number of removed rows.
+        """
+        async with self.session_maker() as session:
+            result = await session.execute(
+                delete(FsmState).where(FsmState.updated_at < datetime.now() - timedelta(seconds=self.ttl))
+            )
+            await session.commit()
+        return result.rowcount
+
+    async def _gc_loop(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                removed = await self.gc()
+                if removed:
+                    logger.info(f"fsm gc: removed {removed} expired states")
+            except Exception as e:
+                logger.error(f"fsm gc failed: {e}")
+
+    def start_gc(self, interval: float = 3600) -> None:
+        if self._gc_task is None:
+            self._gc_task = asyncio.create_task(self._gc_loop(interval))
+
+    async def close(self) -> None:
+        if self._gc_task is not None:
+            self._gc_task.cancel()
+            self._gc_task = None
+
+
+# несколько воркеров делят состояние только через базу
+fsm_storage = SqlStorage(
+    ttl=float(getenv("fsm_ttl", 86400)),
+    cache_size=int(getenv("fsm_cache_size", 4096)),
+    cache_ttl=float(getenv("fsm_cache_ttl", 60)) if PROCESS_CACHES else 0,
+)
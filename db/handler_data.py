@@ -0,0 +1,138 @@
+"""
+Data access of the hot handlers: each function returns everything its handler needs
+in as few round trips as possible. Lists come from the keyboard caches, reads that still
+go to the database share one session, independent round trips run concurrently.
+"""
+import asyncio
+from typing import Any, NamedTuple, Optional
+
+from aiogram.fsm.context import FSMContext
+from aiogram.fsm.state import State
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.cache import body_parts_version, get_body_parts, peek_exercises
+from db.connect import async_session_maker
+from db.fsm import SqlStorage
+from db.models import BodyPart, Exercise, History
+from db.queries import get_history_page
+from db.sets import build_sets
+from db.users import user_resolver
+from db.writer import writer
+
+
+class StartMenu(NamedTuple):
+    version: tuple
+    body_parts: list[dict]
+
+
+class ExerciseView(NamedTuple):
+    name: str
+    bp_id: int
+    history: list[Row]
+    cursor: Optional[int]
+
+
+def _find(items: Optional[list[dict]], item_id: int) -> Optional[dict]:
+    return next((item for item in items or () if item["id"] == item_id), None)
+
+
+async def load_start_menu(tg_user_id: Optional[int] = None, user_name: Optional[str] = None) -> StartMenu:
+    """
+    Body parts for the start keyboard; with `tg_user_id` the user is resolved (created) concurrently.
+    """
+    version = body_parts_version()
+    if tg_user_id is None:
+        return StartMenu(version, await get_body_parts())
+    _, body_parts = await asyncio.gather(user_resolver.resolve(tg_user_id, user_name), get_body_parts())
+    return StartMenu(version, body_parts)
+
+
+async def get_body_part_name(bp_id: int) -> Optional[str]:
+    """
+    Name from the cached list the keyboard was built from, the database only on a miss.
+    """
+    item = _find(await get_body_parts(), bp_id)
+    if item is not None:
+        return item["name"]
+    async with async_session_maker() as session:
+        return (await session.execute(select(BodyPart.name).where(BodyPart.id == bp_id))).scalar()
+
+
+async def get_exercise_name(user_id: int, exercise_id: int) -> Optional[str]:
+    async with async_session_maker() as session:
+        return (await session.execute(
+            select(Exercise.name).where(Exercise.id == exercise_id, Exercise.user_id == user_id)
+        )).scalar()
+
+
+async def load_exercise_view(user_id: int, exercise_id: int, bp_id: Optional[int] = None) -> Optional[ExerciseView]:
+    """
+    Exercise name and body part with the first history page, None if there is no such exercise.
+    The name comes from the cached exercise list of `bp_id` (a keyboard click), otherwise it is read
+    in the same session as the history page (e.g. an exercise from /find).
+    """
+    item = _find(peek_exercises(user_id, bp_id), exercise_id) if bp_id is not None else None
+    async with async_session_maker() as session:
+        if item is not None:
+            name, ex_bp_id = item["name"], int(bp_id)
+        else:
+            row = (await session.execute(
+                select(Exercise.name, Exercise.bp_id).where(Exercise.id == exercise_id)
+            )).first()
+            if row is None:
+                return None
+            name, ex_bp_id = row
+        rows, cursor = await get_history_page(user_id, exercise_id, session=session)
+    return ExerciseView(name, ex_bp_id, rows, cursor)
+
+
+async def set_state_data(state: FSMContext, new_state: Optional[State], **data: Any) -> None:
+    """
+    update_data + set_state with one storage write.
+    """
+    if isinstance(state.storage, SqlStorage):
+        await state.storage.set_state_and_data(state.key, new_state, {**await state.get_data(), **data})
+    else:
+        await state.update_data(**data)
+        await state.set_state(new_state)
+
+
+async def clear_state(state: FSMContext) -> None:
+    """
+    state.clear() with one storage write (a delete) instead of an upsert and a delete.
+    """
+    if isinstance(state.storage, SqlStorage):
+        await state.storage.set_state_and_data(state.key, None, {})
+    else:
+        await state.clear()
+
+
+def _history(user_id: int, data: dict) -> History:
+    hist = History(
+        user_id=int(user_id),
+        bp_id=int(data.get("bp_id", 0)),
+        exercise_id=int(data.get("ex_id", 0)),
+        note=data.get("note", "")
+    )
+    hist.sets = build_sets(hist)
+    return hist
+
+
+async def save_note(state: FSMContext, pending: State, user_id: int) -> bool:
+    """
+    Queues the note waiting for confirmation in `pending` state as a history entry and clears the state.
+    Returns False if there is nothing to save: the note was saved already (a double tap, maybe handled
+    by another worker, or a retry after a restart) or the state is gone.
+    The state is claimed in the same transaction as the insert (see SqlStorage.claim, WriteBehindQueue.add),
+    so the note is saved at most once; with write-behind the insert is batched with other saves.
+    """
+    storage: SqlStorage = state.storage
+
+    async def claim(session: AsyncSession) -> bool:
+        return await storage.claim(session, state.key, pending) is not None
+
+    saved = await writer.add(_history(user_id, await state.get_data()), wait=True, claim=claim)
+    storage.forget(state.key)
+    return saved is not None
@@ -1,7 +1,7 @@
-from datetime import datetime
+from datetime import date, datetime, timezone
 from typing import List
 
-from sqlalchemy import String, ForeignKey
+from sqlalchemy import BigInteger, DateTime, String, ForeignKey, Index, LargeBinary, Text, TypeDecorator
 from sqlalchemy.ext.asyncio import AsyncAttrs
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import relationship, Mapped, mapped_column
@@ -13,11 +13,36 @@ class Base(AsyncAttrs, DeclarativeBase):
     pass
 
 
+class TZDateTime(TypeDecorator):
+    """
+    timestamptz in Postgres, plain DATETIME in SQLite. SQLite keeps naive UTC, as CURRENT_TIMESTAMP
+    of the server default writes it. The application works with naive local time on both backends:
+    binds are converted from local time, results back to naive local.
+    """
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.astimezone()
+        if value is not None and dialect.name != "postgresql":
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        if value is not None:
+            value = value.astimezone().replace(tzinfo=None)
+        return value
+
+
 class User(Base):
     __tablename__ = 'user'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    user_id: Mapped[int] = mapped_column(unique=True, nullable=False)
+    # id в телеграме не помещается в 32 бита
+    user_id: Mapped[int] = mapped_column(BigInteger, unique=True, nullable=False)
     user_name: Mapped[str] = mapped_column(String(50))
 
     # 1:M (1 user -> M exercises)
@@ -47,6 +72,8 @@ class Exercise(Base):
 
     __table_args__ = (
         UniqueConstraint('name', 'bp_id', name='uq_exercise_name_bp_id'),
+        # выбор упражнений пользователя по части тела
+        Index('ix_exercise_user_id_bp_id', 'user_id', 'bp_id', 'name'),
     )
 
 
@@ -54,7 +81,7 @@ class History(Base):
     __tablename__ = 'history'
 
     id: Mapped[int] = mapped_column(primary_key=True)
-    created_at: Mapped[datetime] = mapped_column(default=func.now())
+    created_at: Mapped[datetime] = mapped_column(TZDateTime, default=func.now(), server_default=func.now())
     user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
     bp_id: Mapped[int] = mapped_column(ForeignKey("body_part.id"))
     exercise_id: Mapped[int] = mapped_column(ForeignKey("exercise.id"))
@@ -62,3 +89,101 @@ class History(Base):
 
     exercise: Mapped["Exercise"] = relationship(foreign_keys=[exercise_id])
     body_part: Mapped["BodyPart"] = relationship(foreign_keys=[bp_id])
+    # 1:M (1 запись -> M подходов, разобранных из note)
+    sets: Mapped[List["HistorySet"]] = relationship(back_populates="history")
+
+    __table_args__ = (
+        # история по упражнению (последние записи)
+        Index('ix_history_user_id_exercise_id_created_at', 'user_id', 'exercise_id', 'created_at', 'note'),
+        # статистика за период
+        Index('ix_history_user_id_created_at', 'user_id', 'created_at'),
+    )
+
+
+class HistorySet(Base):
+    __tablename__ = 'history_set'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    history_id: Mapped[int] = mapped_column(ForeignKey("history.id"))
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    exercise_id: Mapped[int] = mapped_column(ForeignKey("exercise.id"))
+    set_index: Mapped[int] = mapped_column()
+    weight: Mapped[float] = mapped_column()
+    reps: Mapped[int] = mapped_column()
+
+    history: Mapped["History"] = relationship(back_populates="sets")
+
+    __table_args__ = (
+        Index('ix_history_set_history_id', 'history_id'),
+        # объем, e1RM и рекорды по упражнению
+        Index('ix_history_set_user_id_exercise_id_weight', 'user_id', 'exercise_id', 'weight', 'reps'),
+    )
+
+
+class ExerciseWeeklyStats(Base):
+    __tablename__ = 'exercise_weekly_stats'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    exercise_id: Mapped[int] = mapped_column(ForeignKey("exercise.id"))
+    # понедельник недели
+    week_start: Mapped[date] = mapped_column()
+    max_weight: Mapped[float] = mapped_column(default=0)
+    volume: Mapped[float] = mapped_column(default=0)
+    best_e1rm: Mapped[float] = mapped_column(default=0)
+    sets_count: Mapped[int] = mapped_column(default=0)
+
+    exercise: Mapped["Exercise"] = relationship(foreign_keys=[exercise_id])
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'exercise_id', 'week_start', name='uq_exercise_weekly_stats_user_ex_week'),
+    )
+
+
+class FsmState(Base):
+    __tablename__ = 'fsm_state'
+
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)
+    state: Mapped[str] = mapped_column(String(255), nullable=True)
+    # json
+    data: Mapped[str] = mapped_column(Text, default="{}")
+    updated_at: Mapped[datetime] = mapped_column(index=True)
+
+
+class HistoryArchive(Base):
+    """
+    History of one user for one year moved out of the hot tables, see db.archive.
+    """
+    __tablename__ = 'history_archive'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    year: Mapped[int] = mapped_column()
+    entries: Mapped[int] = mapped_column()
+    first_at: Mapped[datetime] = mapped_column()
+    last_at: Mapped[datetime] = mapped_column()
+    # сжатый zlib json по колонкам: записи history и их подходы
+    data: Mapped[bytes] = mapped_column(LargeBinary)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'year', name='uq_history_archive_user_year'),
+    )
+
+
+class HistoryArchiveSummary(Base):
+    """
+    Archived entries per exercise and year: which blocks to open without reading them.
+    """
+    __tablename__ = 'history_archive_summary'
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    user_id: Mapped[int] = mapped_column(ForeignKey("user.id"))
+    exercise_id: Mapped[int] = mapped_column(ForeignKey("exercise.id"))
+    year: Mapped[int] = mapped_column()
+    entries: Mapped[int] = mapped_column()
+    last_id: Mapped[int] = mapped_column()
+    last_at: Mapped[datetime] = mapped_column()
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'exercise_id', 'year', name='uq_history_archive_summary_user_ex_year'),
+    )
@@ -0,0 +1,147 @@
+from datetime import datetime
+from typing import AsyncIterator, NamedTuple, Optional
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.engine import Row
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from db.archive import ArchivedEntry, archive_reader
+from db.connect import async_session_maker
+from db.models import BodyPart, Exercise, History, HistorySet
+
+HISTORY_PAGE_SIZE = 10
+
+
+class StatRow(NamedTuple):
+    created_at: datetime
+    bp_id: int
+    bp: str
+    exercise: str
+    note: str
+
+
+async def archived_stat_rows(session: AsyncSession, entries: list[ArchivedEntry]) -> list[StatRow]:
+    """
+    Archived entries with body part and exercise names, entries with missing ones are dropped
+    (as the inner joins of the hot queries do).
+    """
+    if not entries:
+        return []
+    body_parts = dict((await session.execute(
+        select(BodyPart.id, BodyPart.name).where(BodyPart.id.in_({e.bp_id for e in entries}))
+    )).all())
+    exercises = dict((await session.execute(
+        select(Exercise.id, Exercise.name).where(Exercise.id.in_({e.exercise_id for e in entries}))
+    )).all())
+    return [StatRow(e.created_at, e.bp_id, body_parts[e.bp_id], exercises[e.exercise_id], e.note)
+            for e in entries if e.bp_id in body_parts and e.exercise_id in exercises]
+
+
+async def get_history_page(user_id: int, exercise_id: int, before: Optional[int] = None,
+                           limit: int = HISTORY_PAGE_SIZE,
+                           session: Optional[AsyncSession] = None) -> tuple[list[Row], Optional[int]]:
+    """
+    Returns up to `limit` history entries older than the entry with id `before`
+    in chronological order and the id to continue from, or None if there is nothing older.
+    With `session` the page is read in the caller's session.
+    """
+    if session is None:
+        async with async_session_maker() as session:
+            return await get_history_page(user_id, exercise_id, before, limit, session)
+
+    query = select(History.id, History.created_at, History.note).where(
+        and_(History.user_id == user_id, History.exercise_id == int(exercise_id))
+    )
+    if before is not None:
+        # created_at берется из самой записи, чтобы сравнение шло в формате хранения
+        created_at = select(History.created_at).where(History.id == int(before)).scalar_subquery()
+        query = query.where(or_(History.created_at < created_at,
+                                and_(History.created_at == created_at, History.id < int(before))))
+    query = query.order_by(History.created_at.desc(), History.id.desc()).limit(limit + 1)
+    rows = (await session.execute(query)).all()
+
+    if len(rows) <= limit:
+        # горячие записи кончились - продолжаем по архиву, он всегда старше
+        archived = await archive_reader.entries(user_id, int(exercise_id))
+        if before is not None and not rows:
+            # курсор может указывать на архивную запись
+            position = next((i for i, e in enumerate(archived) if e.id == int(before)), None)
+            if position is not None:
+                archived = archived[:position]
+        rows += reversed(archived[-(limit + 1 - len(rows)):])
+
+    cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        cursor = rows[-1].id
+    rows.reverse()
+    return rows, cursor
+
+
+async def get_last_history_id(user_id: int, exercise_id: int) -> Optional[int]:
+    async with async_session_maker() as session:
+        last_id = (await session.execute(
+            select(func.max(History.id)).where(and_(History.user_id == user_id,
+                                                    History.exercise_id == int(exercise_id)))
+        )).scalar()
+    if last_id is None:
+        last_id = await archive_reader.last_id(user_id, int(exercise_id))
+    return last_id
+
+
+async def get_chart_points(user_id: int, exercise_id: int) -> list[tuple]:
+    """
+    (created_at, max weight, volume) per history entry, oldest first.
+    """
+    async with async_session_maker() as session:
+        rows = (await session.execute(
+            select(History.created_at, func.max(HistorySet.weight), func.sum(HistorySet.weight * HistorySet.reps))
+            .join(HistorySet, HistorySet.history_id == History.id)
+            .where(and_(History.user_id == user_id, History.exercise_id == int(exercise_id)))
+            .group_by(History.id, History.created_at)
+            .order_by(History.created_at, History.id)
+        )).all()
+
+    points = []
+    years = await archive_reader.years(user_id, int(exercise_id))
+    for block in (await archive_reader.get_blocks(user_id, years)).values():
+        sets = block.sets_by_entry()
+        for e in block.entries:
+            if e.exercise_id == int(exercise_id) and sets.get(e.id):
+                points.append((e.created_at, max(s.weight for s in sets[e.id]),
+                               sum(s.weight * s.reps for s in sets[e.id])))
+    return points + [tuple(r) for r in rows]
+
+
+async def iter_stat_rows(user_id: int, since: datetime, until: Optional[datetime] = None) -> AsyncIterator[Row]:
+    """
+    Streams (created_at, body part, exercise, note) for the period, grouped by body part.
+    Archived entries of a body part go before its hot entries.
+    """
+    query = (
+        select(History.created_at, BodyPart.id.label("bp_id"), BodyPart.name.label("bp"),
+               Exercise.name.label("exercise"), History.note)
+        .join(BodyPart, BodyPart.id == History.bp_id)
+        .join(Exercise, Exercise.id == History.exercise_id)
+        .where(and_(History.user_id == user_id, History.created_at >= since))
+        .order_by(BodyPart.id, History.created_at, History.id)
+    )
+    if until is not None:
+        query = query.where(History.created_at < until)
+
+    archived = await archive_reader.entries(user_id, since=since, until=until)
+    async with async_session_maker() as session:
+        pending: dict[int, list[StatRow]] = {}
+        for row in await archived_stat_rows(session, archived):
+            pending.setdefault(row.bp_id, []).append(row)
+
+        result = await session.stream(query)
+        async for row in result:
+            for bp_id in sorted(b for b in pending if b <= row.bp_id):
+                for archived_row in pending.pop(bp_id):
+                    yield archived_row
+            yield row
+        for bp_id in sorted(pending):
+            for archived_row in pending[bp_id]:
+                yield archived_row
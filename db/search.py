@@ -0,0 +1,147 @@
+import asyncio
+import re
+from dataclasses import dataclass, field
+from os import getenv
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.future import select
+
+from db.cache import PROCESS_CACHES, TTLCache
+from db.connect import async_session_maker
+from db.models import Exercise
+
+load_dotenv()
+
+WORD_RE = re.compile(r"\w+")
+# доля триграмм запроса, найденных в названии (как word_similarity в pg_trgm)
+SIMILARITY_THRESHOLD = 0.5
+
+
+def normalize(text: str) -> str:
+    return " ".join(WORD_RE.findall(text.lower().replace("ё", "е")))
+
+
+def trigrams(text: str) -> frozenset:
+    """
+    Trigrams of each word padded like pg_trgm: "жим" -> "  ж", " жи", "жим", "им ".
+    """
+    result = set()
+    for word in text.split():
+        padded = f"  {word} "
+        result.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return frozenset(result)
+
+
+@dataclass(frozen=True)
+class Entry:
+    id: int
+    bp_id: int
+    name: str
+    key: str = field(compare=False)
+    grams: frozenset = field(compare=False)
+
+
+def score(entry: Entry, query: str, grams: frozenset) -> float:
+    if entry.key.startswith(query):
+        return 3.0
+    if any(word.startswith(query) for word in entry.key.split()):
+        return 2.0
+    if query in entry.key:
+        return 1.5
+    if not grams:
+        return 0.0
+    return len(entry.grams & grams) / len(grams)
+
+
+class ExerciseIndex:
+    """
+    Exercises of one user with normalized names and trigram sets.
+    """
+
+    def __init__(self):
+        self.entries: Dict[int, Entry] = {}
+
+    def add(self, ex_id: int, bp_id: int, name: str) -> None:
+        key = normalize(name)
+        self.entries[ex_id] = Entry(ex_id, bp_id, name, key, trigrams(key))
+
+    def exact(self, query: str) -> list[Entry]:
+        """
+        Exercises whose normalized name equals the query.
+        """
+        key = normalize(query)
+        return [entry for entry in self.entries.values() if entry.key == key]
+
+    def search(self, query: str, limit: int = 10, bp_id: Optional[int] = None) -> list[Entry]:
+        query = normalize(query)
+        if not query:
+            return []
+        grams = trigrams(query)
+        scored = []
+        for entry in self.entries.values():
+            if bp_id is not None and entry.bp_id != bp_id:
+                continue
+            s = score(entry, query, grams)
+            if s >= SIMILARITY_THRESHOLD:
+                scored.append((-s, entry.name, entry))
+        scored.sort(key=lambda t: t[:2])
+        return [t[2] for t in scored[:limit]]
+
+
+class ExerciseSearch:
+    """
+    Per-user exercise indexes, built lazily from the exercise table on the first search
+    and kept up to date by `add` when an exercise is created.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600):
+        self.indexes = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._loading: Dict[int, asyncio.Future] = {}
+
+    async def _load(self, user_id: int) -> ExerciseIndex:
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(Exercise.id, Exercise.bp_id, Exercise.name).where(Exercise.user_id == user_id)
+            )).all()
+        index = ExerciseIndex()
+        for row in rows:
+            index.add(row.id, row.bp_id, row.name)
+        return index
+
+    async def get_index(self, user_id: int) -> ExerciseIndex:
+        index = self.indexes.get(user_id)
+        if index is not None:
+            return index
+        # несколько одновременных поисков строят индекс одним запросом
+        future = self._loading.get(user_id)
+        if future is None:
+            future = self._loading[user_id] = asyncio.ensure_future(self._load(user_id))
+            try:
+                index = await future
+                self.indexes.set(user_id, index)
+                return index
+            finally:
+                self._loading.pop(user_id, None)
+        return await asyncio.shield(future)
+
+    async def search(self, user_id: int, query: str, limit: int = 10, bp_id: Optional[int] = None) -> list[Entry]:
+        return (await self.get_index(user_id)).search(query, limit, bp_id)
+
+    def add(self, user_id: int, ex_id: int, bp_id: int, name: str) -> None:
+        index = self.indexes.get(user_id)
+        if index is not None:
+            index.add(ex_id, bp_id, name)
+            return
+        # индекс строится прямо сейчас: запрос мог пройти до вставки
+        future = self._loading.get(user_id)
+        if future is not None:
+            future.add_done_callback(
+                lambda f: f.cancelled() or f.exception() or f.result().add(ex_id, bp_id, name))
+        # иначе упражнение попадет в индекс при загрузке
+
+
+exercise_search = ExerciseSearch(
+    maxsize=int(getenv("search_cache_size", 1024)),
+    ttl=float(getenv("search_cache_ttl", 3600)) if PROCESS_CACHES else 0,
+)
@@ -0,0 +1,37 @@
+import re
+from typing import NamedTuple
+
+from db.models import History, HistorySet
+
+# один подход: вес(повторы), например 100(8) или 62.5(10)
+SET_RE = re.compile(r"^\s*(\d+(?:[.,]\d+)?)\s*\(\s*(\d+)\s*\)\s*$")
+
+
+class ParsedSet(NamedTuple):
+    set_index: int
+    weight: float
+    reps: int
+
+
+def parse_note(note: str) -> list[ParsedSet]:
+    """
+    Parses a note like "100(8)-90(7)" into sets. Returns an empty list
+    if any part of the note does not match the format.
+    """
+    if not note:
+        return []
+    sets = []
+    for i, part in enumerate(note.split("-")):
+        match = SET_RE.match(part)
+        if not match:
+            return []
+        sets.append(ParsedSet(i, float(match.group(1).replace(",", ".")), int(match.group(2))))
+    return sets
+
+
+def build_sets(hist: History) -> list[HistorySet]:
+    return [
+        HistorySet(user_id=hist.user_id, exercise_id=hist.exercise_id,
+                   set_index=s.set_index, weight=s.weight, reps=s.reps)
+        for s in parse_note(hist.note)
+    ]
@@ -0,0 +1,172 @@
+"""
+Per-exercise weekly aggregates (max weight, volume, e1RM) kept in exercise_weekly_stats.
+The table is updated in the same flush that inserts new HistorySet rows.
+
+Full rebuild from history_set:
+
+    python -m db.stats --rebuild
+"""
+import argparse
+import asyncio
+from datetime import date, datetime, timedelta
+
+from loguru import logger
+from sqlalchemy import Connection, and_, delete, event, func
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.future import select
+from sqlalchemy.orm import Session
+
+from db.archive import ArchiveBlock
+from db.connect import async_session_maker
+from db.models import Exercise, ExerciseWeeklyStats, History, HistoryArchive, HistorySet
+
+PROGRESS_WEEKS = 8
+
+_KEY = ("user_id", "exercise_id", "week_start")
+
+
+def week_start(dt: datetime) -> date:
+    day = dt.date() if isinstance(dt, datetime) else dt
+    return day - timedelta(days=day.weekday())
+
+
+def e1rm(weight: float, reps: int) -> float:
+    # формула Эпли
+    return weight if reps <= 1 else weight * (1 + reps / 30)
+
+
+def _merge(rows: list[dict]) -> list[dict]:
+    merged = {}
+    for row in rows:
+        key = tuple(row[k] for k in _KEY)
+        acc = merged.get(key)
+        if acc is None:
+            merged[key] = dict(row)
+            continue
+        acc["max_weight"] = max(acc["max_weight"], row["max_weight"])
+        acc["best_e1rm"] = max(acc["best_e1rm"], row["best_e1rm"])
+        acc["volume"] += row["volume"]
+        acc["sets_count"] += row["sets_count"]
+    return list(merged.values())
+
+
+def set_row(user_id: int, exercise_id: int, created_at: datetime, weight: float, reps: int) -> dict:
+    return {
+        "user_id": user_id,
+        "exercise_id": exercise_id,
+        "week_start": week_start(created_at or datetime.now()),
+        "max_weight": weight,
+        "volume": weight * reps,
+        "best_e1rm": e1rm(weight, reps),
+        "sets_count": 1,
+    }
+
+
+def upsert_weekly_stats(connection: Connection, rows: list[dict]) -> None:
+    """
+    Adds increments to exercise_weekly_stats (INSERT ... ON CONFLICT DO UPDATE).
+    """
+    rows = _merge(rows)
+    if not rows:
+        return
+    if connection.dialect.name == "postgresql":
+        insert, greatest = postgresql.insert, func.greatest
+    else:
+        insert, greatest = sqlite.insert, func.max
+
+    table = ExerciseWeeklyStats.__table__
+    stmt = insert(table)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.c[k] for k in _KEY],
+        set_={
+            "max_weight": greatest(table.c.max_weight, stmt.excluded.max_weight),
+            "best_e1rm": greatest(table.c.best_e1rm, stmt.excluded.best_e1rm),
+            "volume": table.c.volume + stmt.excluded.volume,
+            "sets_count": table.c.sets_count + stmt.excluded.sets_count,
+        },
+    )
+    connection.execute(stmt, rows)
+
+
+@event.listens_for(Session, "after_flush")
+def _update_weekly_stats(session: Session, flush_context) -> None:
+    rows = [
+        set_row(s.user_id, s.exercise_id, s.history.created_at if s.history else None, s.weight, s.reps)
+        for s in session.new if isinstance(s, HistorySet)
+    ]
+    if rows:
+        upsert_weekly_stats(session.connection(), rows)
+
+
+async def get_progress(user_id: int, weeks: int = PROGRESS_WEEKS) -> list:
+    since = week_start(datetime.today()) - timedelta(weeks=weeks - 1)
+    async with async_session_maker() as session:
+        result = await session.execute(
+            select(ExerciseWeeklyStats.exercise_id, Exercise.name, ExerciseWeeklyStats.week_start, ExerciseWeeklyStats.max_weight,
+                   ExerciseWeeklyStats.volume, ExerciseWeeklyStats.best_e1rm)
+            .join(Exercise, Exercise.id == ExerciseWeeklyStats.exercise_id)
+            .where(and_(ExerciseWeeklyStats.user_id == user_id, ExerciseWeeklyStats.week_start >= since))
+            .order_by(Exercise.name, ExerciseWeeklyStats.exercise_id, ExerciseWeeklyStats.week_start)
+        )
+        return result.all()
+
+
+async def rebuild(chunk: int) -> None:
+    async with async_session_maker() as session:
+        await session.execute(delete(ExerciseWeeklyStats))
+        await session.commit()
+
+    last_id = 0
+    processed = 0
+    while True:
+        async with async_session_maker() as session:
+            rows = (await session.execute(
+                select(HistorySet.id, HistorySet.user_id, HistorySet.exercise_id, History.created_at,
+                       HistorySet.weight, HistorySet.reps)
+                .join(History, History.id == HistorySet.history_id)
+                .where(HistorySet.id > last_id)
+                .order_by(HistorySet.id)
+                .limit(chunk)
+            )).all()
+            if not rows:
+                break
+            await session.run_sync(lambda s: upsert_weekly_stats(s.connection(), [
+                set_row(r.user_id, r.exercise_id, r.created_at, r.weight, r.reps) for r in rows
+            ]))
+            await session.commit()
+        last_id = rows[-1].id
+        processed += len(rows)
+        logger.info(f"weekly stats rebuild: {processed} sets")
+
+    # подходы из архива: в history_set их больше нет
+    last_id = 0
+    while True:
+        async with async_session_maker() as session:
+            blocks = (await session.execute(
+                select(HistoryArchive.id, HistoryArchive.user_id, HistoryArchive.data)
+                .where(HistoryArchive.id > last_id)
+                .order_by(HistoryArchive.id)
+                .limit(max(1, chunk // 1000))
+            )).all()
+            if not blocks:
+                break
+            rows = []
+            for b in blocks:
+                block = ArchiveBlock.decode(b.data)
+                entries = {e.id: e for e in block.entries}
+                rows.extend(set_row(b.user_id, entries[s.history_id].exercise_id, entries[s.history_id].created_at,
+                                    s.weight, s.reps) for s in block.sets if s.history_id in entries)
+            await session.run_sync(lambda s: upsert_weekly_stats(s.connection(), rows))
+            await session.commit()
+        last_id = blocks[-1].id
+        processed += len(rows)
+        logger.info(f"weekly stats rebuild: {processed} sets (archive)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true")
+    parser.add_argument("--chunk", type=int, default=5000)
+    args = parser.parse_args()
+    if args.rebuild:
+        asyncio.run(rebuild(args.chunk))
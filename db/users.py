@@ -0,0 +1,50 @@
+from os import getenv
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.future import select
+
+from db.cache import TTLCache
+from db.connect import async_session_maker
+from db.models import User
+
+load_dotenv()
+
+
+class UserResolver:
+    """
+    Maps Telegram user ids to `User.id`: bounded LRU/TTL cache in front of the database,
+    the row is created on first sight.
+    """
+
+    def __init__(self, maxsize: int = 4096, ttl: float = 3600.0):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    async def resolve(self, tg_user_id: int, user_name: Optional[str] = None, create: bool = True) -> Optional[int]:
+        user_db_id = self.cache.get(tg_user_id)
+        if user_db_id is not None:
+            return user_db_id
+
+        async with async_session_maker() as session:
+            user_db_id = (await session.execute(select(User.id).where(User.user_id == tg_user_id))).scalar()
+            if user_db_id is None and create:
+                user_db = User(user_id=tg_user_id, user_name=user_name or "")
+                session.add(user_db)
+                try:
+                    await session.commit()
+                    user_db_id = user_db.id
+                except IntegrityError:
+                    # пользователя успел создать другой процесс
+                    await session.rollback()
+                    user_db_id = (await session.execute(select(User.id).where(User.user_id == tg_user_id))).scalar()
+
+        if user_db_id is not None:
+            self.cache.set(tg_user_id, user_db_id)
+        return user_db_id
+
+
+user_resolver = UserResolver(
+    maxsize=int(getenv("user_cache_size", 4096)),
+    ttl=float(getenv("user_cache_ttl", 3600)),
+)
@@ -0,0 +1,94 @@
+import re
+from typing import NamedTuple
+
+from sqlalchemy import insert
+
+from db.connect import async_session_maker
+from db.models import History, HistorySet
+from db.search import exercise_search
+from db.sets import parse_note
+from db.stats import set_row, upsert_weekly_stats
+
+# "Жим лежа: 100(8)-90(7)"
+LINE_RE = re.compile(r"^\s*(?P<name>[^:]+?)\s*:\s*(?P<note>.+?)\s*$")
+# сколько вариантов показать для неоднозначного названия
+AMBIGUOUS_LIMIT = 5
+# длиннее не влезет в history.note: в Postgres упала бы вставка всей тренировки
+NOTE_MAX_LENGTH = History.__table__.c.note.type.length
+
+
+class WorkoutLine(NamedTuple):
+    name: str
+    note: str
+
+
+def parse_workout(text: str) -> tuple[list[WorkoutLine], list[str], list[str]]:
+    """
+    Splits a pasted workout into "exercise: note" lines.
+    Returns parsed lines, lines that do not match the format
+    and lines with a note longer than NOTE_MAX_LENGTH.
+    """
+    parsed, bad, too_long = [], [], []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        match = LINE_RE.match(line)
+        if match is None or not parse_note(match.group("note")):
+            bad.append(line.strip())
+            continue
+        note = match.group("note").replace(" ", "")
+        if len(note) > NOTE_MAX_LENGTH:
+            too_long.append(line.strip())
+            continue
+        parsed.append(WorkoutLine(match.group("name"), note))
+    return parsed, bad, too_long
+
+
+async def resolve_lines(user_id: int, lines: list[WorkoutLine]) -> tuple[list[dict], list[str], list[tuple]]:
+    """
+    Matches exercise names against the user's exercises in the in-memory search index.
+    A name is accepted only if it equals an exercise name or the search finds exactly one exercise.
+    Returns entries for the FSM buffer, names that were not found
+    and (name, candidate names) for ambiguous ones.
+    """
+    index = await exercise_search.get_index(user_id)
+    entries, unknown, ambiguous = [], [], []
+    for line in lines:
+        found = index.exact(line.name) or index.search(line.name, limit=AMBIGUOUS_LIMIT)
+        if not found:
+            unknown.append(line.name)
+            continue
+        if len(found) > 1:
+            ambiguous.append((line.name, [ex.name for ex in found]))
+            continue
+        ex = found[0]
+        entries.append({"ex_id": ex.id, "bp_id": ex.bp_id, "exercise": ex.name, "note": line.note})
+    return entries, unknown, ambiguous
+
+
+async def save_workout(user_id: int, entries: list[dict]) -> int:
+    """
+    Saves buffered entries in one transaction: one bulk insert into history,
+    one into history_set and one weekly stats upsert, whatever the number of entries.
+    """
+    if not entries:
+        return 0
+    async with async_session_maker() as session:
+        history = (await session.execute(
+            insert(History).returning(History.id, History.created_at, sort_by_parameter_order=True),
+            [{"user_id": user_id, "bp_id": e["bp_id"], "exercise_id": e["ex_id"], "note": e["note"]}
+             for e in entries],
+        )).all()
+
+        sets, stats = [], []
+        for h, e in zip(history, entries):
+            for parsed in parse_note(e["note"]):
+                sets.append({"history_id": h.id, "user_id": user_id, "exercise_id": e["ex_id"],
+                             "set_index": parsed.set_index, "weight": parsed.weight, "reps": parsed.reps})
+                stats.append(set_row(user_id, e["ex_id"], h.created_at, parsed.weight, parsed.reps))
+        if sets:
+            # Core insert мимо ORM: after_flush из db.stats не сработает, агрегаты обновляем сами
+            await session.execute(insert(HistorySet), sets)
+            await session.run_sync(lambda sync_session: upsert_weekly_stats(sync_session.connection(), stats))
+        await session.commit()
+    return len(entries)
@@ -0,0 +1,151 @@
+import asyncio
+from os import getenv
+from typing import Awaitable, Callable, Optional
+
+from dotenv import load_dotenv
+from loguru import logger
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from db.connect import async_session_maker
+from db.models import Base
+
+load_dotenv()
+
+_STOP = object()
+
+# проверка в транзакции вставки: False - строку не вставлять (например, уже сохранена)
+Claim = Callable[[AsyncSession], Awaitable[bool]]
+
+
+class WriteBehindQueue:
+    """
+    Groups ORM inserts into one transaction per `batch_size` rows or `flush_interval` seconds.
+    Until `start()` is called (or after `stop()`) every insert is committed right away.
+    """
+
+    def __init__(self, session_maker: async_sessionmaker = async_session_maker, batch_size: int = 100,
+                 flush_interval: float = 0.05, max_pending: int = 10000):
+        self.session_maker = session_maker
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.flushed = 0
+        self.batches = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"write-behind started: batch {self.batch_size}, interval {self.flush_interval}s")
+
+    async def stop(self) -> None:
+        """
+        Flushes everything that is queued and stops the flusher task.
+        """
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+        logger.info(f"write-behind stopped: {self.flushed} rows in {self.batches} batches")
+
+    async def add(self, obj: Base, wait: bool = False, claim: Optional[Claim] = None) -> Optional[Base]:
+        """
+        Queues `obj` for insert. With `wait=True` returns only after the batch with `obj`
+        is committed (needed when the caller uses the generated id or the claim result).
+        `claim` runs in the same transaction right before the insert; if it returns False,
+        `obj` is skipped and None is returned.
+        """
+        if not self.running:
+            async with self.session_maker() as session:
+                if not await self._add(session, obj, claim):
+                    return None
+                await session.commit()
+            return obj
+
+        future = asyncio.get_running_loop().create_future() if wait else None
+        await self._queue.put((obj, future, claim))
+        if future is not None:
+            return await future
+        return obj
+
+    @staticmethod
+    async def _add(session: AsyncSession, obj: Base, claim: Optional[Claim]) -> bool:
+        if claim is not None and not await claim(session):
+            return False
+        session.add(obj)
+        return True
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            await self._flush(batch)
+
+        # все, что успели положить после сигнала остановки
+        rest = []
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not _STOP:
+                rest.append(item)
+        if rest:
+            await self._flush(rest)
+
+    async def _flush(self, batch: list) -> None:
+        try:
+            async with self.session_maker() as session:
+                added = [await self._add(session, obj, claim) for obj, _, claim in batch]
+                await session.commit()
+        except Exception as e:
+            logger.error(f"write-behind batch of {len(batch)} failed, retrying row by row: {e}")
+            for obj, future, claim in batch:
+                try:
+                    async with self.session_maker() as session:
+                        row_added = await self._add(session, obj, claim)
+                        await session.commit()
+                except Exception as row_error:
+                    logger.error(f"write-behind insert failed: {row_error}")
+                    if future is not None and not future.done():
+                        future.set_exception(row_error)
+                else:
+                    self.flushed += row_added
+                    if future is not None and not future.done():
+                        future.set_result(obj if row_added else None)
+            self.batches += 1
+            return
+
+        self.flushed += sum(added)
+        self.batches += 1
+        for (obj, future, _), row_added in zip(batch, added):
+            if future is not None and not future.done():
+                future.set_result(obj if row_added else None)
+
+
+writer = WriteBehindQueue(
+    batch_size=int(getenv("write_batch_size", 100)),
+    flush_interval=int(getenv("write_flush_ms", 50)) / 1000,
+)
@@ -0,0 +1,268 @@
+"""
+In-process metrics in Prometheus text format:
+- bot_handler_seconds{handler, prefix} - handler latency (aiogram middleware);
+- bot_db_query_seconds{statement} - SQL statement time (cursor execute events);
+- bot_telegram_request_seconds{method} - Bot API call latency (session middleware);
+- bot_handler_errors_total{handler, prefix}.
+
+Metrics are per process: with several webhook workers every worker reports its own.
+"""
+import bisect
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import GetUpdates
+from aiogram.types import CallbackQuery, Message, TelegramObject
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+if TYPE_CHECKING:
+    # aiohttp.web нужен только серверу /metrics, импортируется при его запуске
+    from aiohttp import web
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+STATEMENT_RE = re.compile(r"^\s*(SELECT|INSERT|UPDATE|DELETE|PRAGMA|BEGIN|COMMIT|ROLLBACK|\w+)"
+                          r"(?:.*?\b(?:FROM|INTO|UPDATE)\s+\"?(\w+))?", re.I | re.S)
+
+
+class Histogram:
+    def __init__(self, buckets: tuple = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Upper bound of the bucket holding the q-quantile.
+        """
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return float("inf")
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels: tuple) -> str:
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels)
+
+
+class Registry:
+    def __init__(self):
+        self.histograms: Dict[str, Dict[tuple, Histogram]] = defaultdict(dict)
+        self.counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        histogram = self.histograms[name].get(key)
+        if histogram is None:
+            histogram = self.histograms[name][key] = Histogram()
+        histogram.observe(value)
+
+    def inc(self, name: str, value: float = 1, **labels) -> None:
+        self.counters[name][tuple(sorted(labels.items()))] += value
+
+    def clear(self) -> None:
+        self.histograms.clear()
+        self.counters.clear()
+
+    def render(self) -> str:
+        lines = []
+        for name, series in self.histograms.items():
+            lines.append(f"# TYPE {name} histogram")
+            for labels, h in series.items():
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{{{_labels(labels + (('le', le),))}}} {cumulative}")
+                lines.append(f"{name}_sum{{{_labels(labels)}}} {h.sum:.6f}")
+                lines.append(f"{name}_count{{{_labels(labels)}}} {h.count}")
+        for name, series in self.counters.items():
+            lines.append(f"# TYPE {name} counter")
+            for labels, value in series.items():
+                lines.append(f"{name}{{{_labels(labels)}}} {value:g}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> list[str]:
+        """
+        Human-readable lines sorted by total time: name, labels, count, avg, p95.
+        """
+        rows = []
+        for name, series in self.histograms.items():
+            for labels, h in series.items():
+                rows.append((h.sum, f"{name.removeprefix('bot_').removesuffix('_seconds')} "
+                                    f"{' '.join(str(v) for _, v in labels)}: n={h.count} "
+                                    f"avg={h.sum / h.count * 1000:.1f}ms p95<={h.quantile(0.95) * 1000:g}ms"))
+        return [line for _, line in sorted(rows, reverse=True)]
+
+
+registry = Registry()
+
+# счетчики SQL-запросов и вызовов Bot API текущей задачи, см. count_queries и count_requests
+_query_counter: ContextVar = ContextVar("query_counter", default=None)
+_request_counter: ContextVar = ContextVar("request_counter", default=None)
+
+
+@contextmanager
+def _count(counter_var: ContextVar):
+    counter = [0]
+    token = counter_var.set(counter)
+    try:
+        yield counter
+    finally:
+        counter_var.reset(token)
+
+
+def count_queries():
+    """
+    Counts statements executed by the current task (and the tasks it starts) inside the block:
+
+        with count_queries() as queries:
+            ...
+        queries[0]
+    """
+    return _count(_query_counter)
+
+
+def count_requests():
+    """
+    Same for Bot API calls made through a session with RequestMetricsMiddleware.
+    """
+    return _count(_request_counter)
+
+
+def statement_label(statement: str) -> str:
+    """
+    "SELECT ... FROM history ..." -> "SELECT history", keeps label cardinality low.
+    """
+    match = STATEMENT_RE.match(statement)
+    if match is None:
+        return "other"
+    verb, table = match.group(1).upper(), match.group(2)
+    return f"{verb} {table}" if table else verb
+
+
+def instrument_engine(engine: AsyncEngine, metrics: Registry = registry) -> None:
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+        counter = _query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_started"].pop()
+        metrics.observe("bot_db_query_seconds", time.perf_counter() - started, statement=statement_label(statement))
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(context):
+        if context.connection is not None and context.connection.info.get("query_started"):
+            context.connection.info["query_started"].pop()
+
+
+def event_labels(event: TelegramObject, data: Dict[str, Any], resolve_callback=None) -> tuple[str, str]:
+    handler = data.get("handler")
+    name = getattr(handler.callback, "__name__", "unknown") if handler else "unknown"
+    prefix = ""
+    if isinstance(event, CallbackQuery):
+        prefix = (event.data or "").partition(":")[0]
+        if resolve_callback is not None:
+            resolved = resolve_callback(prefix)
+            # устаревшие кнопки не должны плодить метки
+            name, prefix = (resolved, prefix) if resolved else (name, "unknown")
+    elif isinstance(event, Message) and event.text and event.text.startswith("/"):
+        # несколько обработчиков команд называются одинаково, различаем по команде
+        prefix = event.text.split()[0].split("@")[0]
+    return name, prefix
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Inner middleware: latency of the handler that was picked for the event.
+    """
+
+    def __init__(self, metrics: Registry = registry, resolve_callback: Optional[Callable[[str], Optional[str]]] = None):
+        self.metrics = metrics
+        self.resolve_callback = resolve_callback
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            name, prefix = event_labels(event, data, self.resolve_callback)
+            self.metrics.inc("bot_handler_errors_total", handler=name, prefix=prefix)
+            raise
+        finally:
+            name, prefix = event_labels(event, data, self.resolve_callback)
+            self.metrics.observe("bot_handler_seconds", time.perf_counter() - started, handler=name, prefix=prefix)
+
+
+class RequestMetricsMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware: latency of every Bot API call.
+    """
+
+    def __init__(self, metrics: Registry = registry):
+        self.metrics = metrics
+
+    async def __call__(self, make_request, bot, method):
+        counter = _request_counter.get()
+        if counter is not None:
+            counter[0] += 1
+        if isinstance(method, GetUpdates):
+            # long polling: время ожидания апдейтов, а не задержка API
+            return await make_request(bot, method)
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            self.metrics.observe("bot_telegram_request_seconds", time.perf_counter() - started,
+                                 method=getattr(method, "__api_method__", type(method).__name__))
+
+
+async def handle_metrics(request: "web.Request") -> "web.Response":
+    from aiohttp import web
+
+    return web.Response(text=registry.render(), content_type="text/plain", headers={"Cache-Control": "no-cache"})
+
+
+async def serve(host: str, port: int) -> "web.AppRunner":
+    """
+    Standalone /metrics endpoint for polling mode.
+    """
+    from aiohttp import web
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
@@ -0,0 +1,109 @@
+import asyncio
+import itertools
+import time
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from callbacks import BpPage, ExHist, ExPage, Save
+from db.cache import TTLCache
+
+# нажатия пагинации: имеет смысл только последнее
+COALESCE_PREFIXES = tuple(f"{cb.__prefix__}:" for cb in (BpPage, ExPage, ExHist))
+# сохранение записи: повтор в этом процессе отсекается здесь, не доходя до базы
+IDEMPOTENT_PREFIXES = (Save(flag=1).pack(),)
+
+
+class CallbackThrottleMiddleware(BaseMiddleware):
+    """
+    Outer middleware for callback queries:
+    - per-user token bucket, throttled callbacks are only answered;
+    - pagination taps on the same message are coalesced, only the latest one runs;
+    - save callbacks are deduplicated by (user, message) within the process; the save itself
+      is idempotent in the database (db.handler_data.save_note), this only spares the round trip.
+    """
+
+    def __init__(self, rate: float = 3.0, burst: int = 6, dedupe_ttl: float = 600, max_users: int = 10000):
+        self.rate = rate
+        self.burst = burst
+        self.stats: Counter = Counter()
+        self._buckets = TTLCache(maxsize=max_users, ttl=burst / rate * 2)
+        self._dedupe = TTLCache(maxsize=max_users, ttl=dedupe_ttl)
+        self._seq = itertools.count()
+        self._latest: Dict[tuple, int] = {}
+        self._in_flight: Dict[tuple, str] = {}
+        self._locks: Dict[tuple, asyncio.Lock] = {}
+
+    def _take_token(self, user_id: int) -> bool:
+        now = time.monotonic()
+        tokens, last = self._buckets.get(user_id) or (self.burst, now)
+        tokens = min(self.burst, tokens + (now - last) * self.rate)
+        if tokens < 1:
+            self._buckets.set(user_id, (tokens, now))
+            return False
+        self._buckets.set(user_id, (tokens - 1, now))
+        return True
+
+    async def __call__(
+            self,
+            handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+            event: CallbackQuery,
+            data: Dict[str, Any],
+    ) -> Any:
+        self.stats["total"] += 1
+        if not self._take_token(event.from_user.id):
+            self.stats["throttled"] += 1
+            await event.answer("Не так быстро")
+            return None
+
+        callback_data = event.data or ""
+        message_id = event.message.message_id if event.message else None
+        key = (event.from_user.id, message_id)
+
+        if callback_data.startswith(IDEMPOTENT_PREFIXES):
+            dedupe_key = (key, callback_data)
+            if self._dedupe.get(dedupe_key):
+                self.stats["dropped"] += 1
+                await event.answer()
+                return None
+            self._dedupe.set(dedupe_key, True)
+            try:
+                return await handler(event, data)
+            except Exception:
+                self._dedupe.invalidate(dedupe_key)
+                raise
+
+        if callback_data.startswith(COALESCE_PREFIXES):
+            return await self._coalesced(handler, event, data, key, callback_data)
+
+        return await handler(event, data)
+
+    async def _coalesced(self, handler, event: CallbackQuery, data: Dict[str, Any], key: tuple,
+                         callback_data: str) -> Any:
+        if self._in_flight.get(key) == callback_data:
+            # та же страница уже открывается
+            self.stats["coalesced"] += 1
+            await event.answer()
+            return None
+
+        seq = next(self._seq)
+        self._latest[key] = seq
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                if self._latest.get(key) != seq:
+                    # пока ждали, пришло более новое нажатие
+                    self.stats["coalesced"] += 1
+                    await event.answer()
+                    return None
+                self._in_flight[key] = callback_data
+                try:
+                    return await handler(event, data)
+                finally:
+                    self._in_flight.pop(key, None)
+        finally:
+            if self._latest.get(key) == seq:
+                self._latest.pop(key, None)
+                self._locks.pop(key, None)
@@ -0,0 +1,105 @@
+"""
+Database migrations outside of the bot hot path.
+
+    python migrate.py            # upgrade to head
+    python migrate.py --check    # exit code 1 if the database is behind head
+
+The check reads alembic_version and the revision headers of the version files as text,
+alembic and the migration scripts are only loaded when an upgrade is really needed.
+"""
+import argparse
+import asyncio
+import configparser
+import os
+import re
+import sys
+from os import getenv
+from typing import Optional
+
+from dotenv import load_dotenv
+from sqlalchemy import NullPool, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import create_async_engine
+
+load_dotenv()
+
+REVISION_RE = re.compile(r"^revision(?:\s*:[^=]*)?=\s*['\"]([^'\"]+)['\"]", re.M)
+DOWN_REVISION_RE = re.compile(r"^down_revision(?:\s*:[^=]*)?=\s*(.+)$", re.M)
+
+
+def versions_dir(config_file: Optional[str] = None) -> str:
+    config_file = config_file or getenv("alembic_cfg")
+    parser = configparser.ConfigParser()
+    parser.read(config_file)
+    location = parser.get("alembic", "script_location")
+    return os.path.join(os.path.dirname(os.path.abspath(config_file)), location, "versions")
+
+
+def head_revisions(directory: Optional[str] = None) -> set[str]:
+    """
+    Revisions no other revision is based on, taken from the version files without importing them.
+    """
+    directory = directory or versions_dir()
+    revisions, parents = set(), set()
+    for name in os.listdir(directory):
+        if not name.endswith(".py"):
+            continue
+        with open(os.path.join(directory, name), encoding="utf-8") as f:
+            source = f.read()
+        revision = REVISION_RE.search(source)
+        if revision is None:
+            continue
+        revisions.add(revision.group(1))
+        down_revision = DOWN_REVISION_RE.search(source)
+        if down_revision:
+            parents.update(re.findall(r"['\"]([^'\"]+)['\"]", down_revision.group(1)))
+    return revisions - parents
+
+
+async def _current_revisions(url: str) -> set[str]:
+    engine = create_async_engine(url, poolclass=NullPool)
+    try:
+        async with engine.connect() as connection:
+            return {r[0] for r in await connection.execute(text("SELECT version_num FROM alembic_version"))}
+    except DBAPIError:
+        # таблицы еще нет - база пустая
+        return set()
+    finally:
+        await engine.dispose()
+
+
+def current_revisions(url: Optional[str] = None) -> set[str]:
+    return asyncio.run(_current_revisions(url or getenv("async_db_url")))
+
+
+def is_up_to_date() -> bool:
+    return current_revisions() == head_revisions()
+
+
+def upgrade(revision: str = "head") -> None:
+    from alembic import command
+    from alembic.config import Config
+
+    command.upgrade(Config(getenv("alembic_cfg")), revision)
+
+
+def ensure_up_to_date() -> bool:
+    """
+    Upgrades the database if it is behind head, returns True if an upgrade was run.
+    """
+    if is_up_to_date():
+        return False
+    upgrade()
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--check", action="store_true")
+    args = parser.parse_args()
+
+    if args.check:
+        current, head = current_revisions(), head_revisions()
+        print(f"current: {', '.join(sorted(current)) or '-'}, head: {', '.join(sorted(head))}")
+        sys.exit(0 if current == head else 1)
+    upgrade()
@@ -0,0 +1,29 @@
+"""hot query indexes
+
+Revision ID: 2
+Revises: 1
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '2'
+down_revision: Union[str, None] = '1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_exercise_user_id_bp_id', 'exercise', ['user_id', 'bp_id', 'name'], unique=False)
+    op.create_index('ix_history_user_id_exercise_id_created_at', 'history',
+                    ['user_id', 'exercise_id', 'created_at', 'note'], unique=False)
+    op.create_index('ix_history_user_id_created_at', 'history', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_history_user_id_created_at', table_name='history')
+    op.drop_index('ix_history_user_id_exercise_id_created_at', table_name='history')
+    op.drop_index('ix_exercise_user_id_bp_id', table_name='exercise')
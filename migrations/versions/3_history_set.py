@@ -0,0 +1,42 @@
+"""history set
+
+Revision ID: 3
+Revises: 2
+Create Date: 2026-10-17 13:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '3'
+down_revision: Union[str, None] = '2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('history_set',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('history_id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('exercise_id', sa.Integer(), nullable=False),
+                    sa.Column('set_index', sa.Integer(), nullable=False),
+                    sa.Column('weight', sa.Float(), nullable=False),
+                    sa.Column('reps', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['history_id'], ['history.id'], ),
+                    sa.ForeignKeyConstraint(['exercise_id'], ['exercise.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id')
+                    )
+    op.create_index('ix_history_set_history_id', 'history_set', ['history_id'], unique=False)
+    op.create_index('ix_history_set_user_id_exercise_id_weight', 'history_set',
+                    ['user_id', 'exercise_id', 'weight', 'reps'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_history_set_user_id_exercise_id_weight', table_name='history_set')
+    op.drop_index('ix_history_set_history_id', table_name='history_set')
+    op.drop_table('history_set')
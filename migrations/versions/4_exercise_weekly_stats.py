@@ -0,0 +1,39 @@
+"""exercise weekly stats
+
+Revision ID: 4
+Revises: 3
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '4'
+down_revision: Union[str, None] = '3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('exercise_weekly_stats',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('exercise_id', sa.Integer(), nullable=False),
+                    sa.Column('week_start', sa.Date(), nullable=False),
+                    sa.Column('max_weight', sa.Float(), nullable=False),
+                    sa.Column('volume', sa.Float(), nullable=False),
+                    sa.Column('best_e1rm', sa.Float(), nullable=False),
+                    sa.Column('sets_count', sa.Integer(), nullable=False),
+                    sa.ForeignKeyConstraint(['exercise_id'], ['exercise.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('user_id', 'exercise_id', 'week_start',
+                                        name='uq_exercise_weekly_stats_user_ex_week')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('exercise_weekly_stats')
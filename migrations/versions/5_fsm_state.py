@@ -0,0 +1,33 @@
+"""fsm state
+
+Revision ID: 5
+Revises: 4
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '5'
+down_revision: Union[str, None] = '4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('fsm_state',
+                    sa.Column('key', sa.String(length=255), nullable=False),
+                    sa.Column('state', sa.String(length=255), nullable=True),
+                    sa.Column('data', sa.Text(), nullable=False),
+                    sa.Column('updated_at', sa.DateTime(), nullable=False),
+                    sa.PrimaryKeyConstraint('key')
+                    )
+    op.create_index('ix_fsm_state_updated_at', 'fsm_state', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_fsm_state_updated_at', table_name='fsm_state')
+    op.drop_table('fsm_state')
@@ -0,0 +1,37 @@
+"""postgres types
+
+Revision ID: 6
+Revises: 5
+Create Date: 2026-10-17 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '6'
+down_revision: Union[str, None] = '5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite: INTEGER и так 64-битный, тип даты не хранится, created_at заполняет ORM -
+    # пересобирать таблицу history ради server default незачем
+    if op.get_context().dialect.name != "postgresql":
+        return
+    op.alter_column('user', 'user_id', type_=sa.BigInteger(), existing_type=sa.Integer(), existing_nullable=False)
+    # старые значения - локальное время сервера, приводятся в часовом поясе сессии
+    op.alter_column('history', 'created_at', type_=sa.DateTime(timezone=True), existing_type=sa.DateTime(),
+                    server_default=sa.func.now(), existing_nullable=False,
+                    postgresql_using='created_at::timestamptz')
+
+
+def downgrade() -> None:
+    if op.get_context().dialect.name != "postgresql":
+        return
+    op.alter_column('history', 'created_at', type_=sa.DateTime(), existing_type=sa.DateTime(timezone=True),
+                    server_default=None, existing_nullable=False, postgresql_using='created_at::timestamp')
+    op.alter_column('user', 'user_id', type_=sa.Integer(), existing_type=sa.BigInteger(), existing_nullable=False)
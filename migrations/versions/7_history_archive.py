@@ -0,0 +1,51 @@
+"""history archive
+
+Revision ID: 7
+Revises: 6
+Create Date: 2026-10-17 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '7'
+down_revision: Union[str, None] = '6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('history_archive',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('year', sa.Integer(), nullable=False),
+                    sa.Column('entries', sa.Integer(), nullable=False),
+                    sa.Column('first_at', sa.DateTime(), nullable=False),
+                    sa.Column('last_at', sa.DateTime(), nullable=False),
+                    sa.Column('data', sa.LargeBinary(), nullable=False),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('user_id', 'year', name='uq_history_archive_user_year')
+                    )
+    op.create_table('history_archive_summary',
+                    sa.Column('id', sa.Integer(), nullable=False),
+                    sa.Column('user_id', sa.Integer(), nullable=False),
+                    sa.Column('exercise_id', sa.Integer(), nullable=False),
+                    sa.Column('year', sa.Integer(), nullable=False),
+                    sa.Column('entries', sa.Integer(), nullable=False),
+                    sa.Column('last_id', sa.Integer(), nullable=False),
+                    sa.Column('last_at', sa.DateTime(), nullable=False),
+                    sa.ForeignKeyConstraint(['exercise_id'], ['exercise.id'], ),
+                    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+                    sa.PrimaryKeyConstraint('id'),
+                    sa.UniqueConstraint('user_id', 'exercise_id', 'year',
+                                        name='uq_history_archive_summary_user_ex_year')
+                    )
+
+
+def downgrade() -> None:
+    op.drop_table('history_archive_summary')
+    op.drop_table('history_archive')
@@ -0,0 +1,64 @@
+import html
+from datetime import date, datetime, timedelta
+from datetime import time as dtime
+from os import getenv
+from typing import Optional
+
+from aiogram import Bot
+from dotenv import load_dotenv
+from loguru import logger
+
+from db.digest import Digest, get_stale_body_parts, get_weekly_digests
+from db.stats import week_start
+from scheduler import BatchSender, Scheduler
+
+load_dotenv()
+
+DIGEST_WEEKDAY = int(getenv("digest_weekday", 0))
+DIGEST_TIME = dtime(int(getenv("digest_hour", 10)))
+# 0 - напоминания выключены
+REMINDER_DAYS = int(getenv("reminder_days", 0))
+REMINDER_TIME = dtime(int(getenv("reminder_hour", 18)))
+SEND_RATE = float(getenv("send_rate", 20))
+
+
+def format_digest(digest: Digest, week: date) -> str:
+    lines = [f"<b>Итоги недели {week.strftime('%d.%m')} - {(week + timedelta(days=6)).strftime('%d.%m')}</b>",
+             f"Тренировок: {digest.sessions}"]
+    for bp, (entries, volume) in digest.body_parts.items():
+        lines.append(f"{html.escape(bp)}: записей {entries}, объем {volume:g}")
+    if digest.records:
+        lines.append("")
+        lines.append("Новые рекорды:")
+        lines += [f"{html.escape(name)}: {weight:g}" for name, weight in digest.records.items()]
+    return "\n".join(lines)
+
+
+def format_reminder(stale: list[tuple[str, int]]) -> str:
+    parts = ", ".join(f"{html.escape(bp)} - {days} дн." for bp, days in stale)
+    return f"Давно не тренировали: {parts}\n/start"
+
+
+async def send_weekly_digests(bot: Bot, week: Optional[date] = None) -> None:
+    week = week or week_start(datetime.today()) - timedelta(weeks=1)
+    digests = await get_weekly_digests(week)
+    stats = await BatchSender(bot, rate=SEND_RATE).send_all(
+        (tg_id, format_digest(d, week)) for tg_id, d in digests.items()
+    )
+    logger.info(f"weekly digest {week}: {len(digests)} users, {dict(stats)}")
+
+
+async def send_reminders(bot: Bot, days: int = REMINDER_DAYS) -> None:
+    stale = await get_stale_body_parts(days)
+    stats = await BatchSender(bot, rate=SEND_RATE).send_all(
+        (tg_id, format_reminder(bps)) for tg_id, bps in stale.items()
+    )
+    logger.info(f"reminders: {len(stale)} users, {dict(stats)}")
+
+
+def build_scheduler(bot: Bot) -> Scheduler:
+    scheduler = Scheduler()
+    scheduler.weekly(DIGEST_WEEKDAY, DIGEST_TIME, lambda: send_weekly_digests(bot), name="weekly digest")
+    if REMINDER_DAYS > 0:
+        scheduler.daily(REMINDER_TIME, lambda: send_reminders(bot), name="reminders")
+    return scheduler
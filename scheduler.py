@@ -0,0 +1,149 @@
+import asyncio
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from datetime import time as dtime
+from typing import Awaitable, Callable, Iterable, Optional
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramNetworkError, TelegramRetryAfter
+from loguru import logger
+
+Job = Callable[[], Awaitable[None]]
+
+
+class RateLimiter:
+    """
+    Token bucket shared by sender workers; `pause` stops all of them (after RetryAfter).
+    """
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class BatchSender:
+    """
+    Sends many messages under Telegram limits: `rate` messages per second overall
+    (kept below the 30/s limit to leave room for interactive replies) and at most one message
+    per `per_chat_interval` seconds to a chat. RetryAfter pauses every worker and the message
+    is retried, chats that blocked the bot are skipped.
+    """
+
+    def __init__(self, bot: Bot, rate: float = 20, per_chat_interval: float = 1.0, workers: int = 4,
+                 max_retries: int = 3):
+        self.bot = bot
+        self.limiter = RateLimiter(rate, burst=workers)
+        self.per_chat_interval = per_chat_interval
+        self.workers = workers
+        self.max_retries = max_retries
+        self._chat_last: dict[int, float] = {}
+
+    async def _send(self, chat_id: int, text: str, stats: Counter) -> None:
+        for attempt in range(self.max_retries + 1):
+            wait = self._chat_last.get(chat_id, 0) + self.per_chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            await self.limiter.acquire()
+            self._chat_last[chat_id] = time.monotonic()
+            try:
+                await self.bot.send_message(chat_id, text)
+                stats["sent"] += 1
+                return
+            except TelegramRetryAfter as e:
+                stats["retry_after"] += 1
+                self.limiter.pause(e.retry_after)
+            except TelegramForbiddenError:
+                stats["blocked"] += 1
+                return
+            except TelegramNetworkError as e:
+                stats["network_errors"] += 1
+                logger.warning(f"send to {chat_id} failed: {e}")
+                await asyncio.sleep(2 ** attempt)
+            except Exception as e:
+                stats["failed"] += 1
+                logger.error(f"send to {chat_id} failed: {e}")
+                return
+        stats["failed"] += 1
+
+    async def send_all(self, messages: Iterable[tuple[int, str]]) -> Counter:
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+        stats: Counter = Counter()
+
+        async def worker() -> None:
+            while not queue.empty():
+                chat_id, text = queue.get_nowait()
+                await self._send(chat_id, text, stats)
+
+        await asyncio.gather(*(worker() for _ in range(self.workers)))
+        self._chat_last.clear()
+        return stats
+
+
+class Scheduler:
+    """
+    Runs jobs daily or weekly at a local time. Every job is a separate task, so a long job
+    does not delay the others; a failed run is logged and the job is scheduled again.
+    """
+
+    def __init__(self):
+        self._jobs: list[tuple[str, Optional[int], dtime, Job]] = []
+        self._tasks: list[asyncio.Task] = []
+
+    def daily(self, at: dtime, job: Job, name: Optional[str] = None) -> None:
+        self._jobs.append((name or job.__name__, None, at, job))
+
+    def weekly(self, weekday: int, at: dtime, job: Job, name: Optional[str] = None) -> None:
+        self._jobs.append((name or job.__name__, weekday, at, job))
+
+    @staticmethod
+    def next_run(now: datetime, weekday: Optional[int], at: dtime) -> datetime:
+        run = datetime.combine(now.date(), at)
+        if weekday is not None:
+            run += timedelta(days=(weekday - now.weekday()) % 7)
+        if run <= now:
+            run += timedelta(days=7 if weekday is not None else 1)
+        return run
+
+    async def _loop(self, name: str, weekday: Optional[int], at: dtime, job: Job) -> None:
+        while True:
+            run = self.next_run(datetime.now(), weekday, at)
+            logger.info(f"scheduler: {name} at {run}")
+            await asyncio.sleep((run - datetime.now()).total_seconds())
+            started = time.perf_counter()
+            try:
+                await job()
+                logger.info(f"scheduler: {name} done in {time.perf_counter() - started:.1f}s")
+            except Exception as e:
+                logger.error(f"scheduler: {name} failed: {e}")
+
+    def start(self) -> None:
+        for name, weekday, at, job in self._jobs:
+            self._tasks.append(asyncio.create_task(self._loop(name, weekday, at, job)))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
@@ -0,0 +1,29 @@
+from time import perf_counter
+
+from loguru import logger
+
+
+class StartupTimer:
+    """
+    Wall time of startup phases, counted from the import of this module.
+    """
+
+    def __init__(self):
+        self.started = perf_counter()
+        self._last = self.started
+        self.phases: dict[str, float] = {}
+
+    def mark(self, phase: str) -> None:
+        now = perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0) + now - self._last
+        self._last = now
+
+    def total(self) -> float:
+        return self._last - self.started
+
+    def report(self) -> None:
+        phases = ", ".join(f"{name} {seconds:.3f}s" for name, seconds in self.phases.items())
+        logger.info(f"startup: {phases}, total {self.total():.3f}s")
+
+
+startup_timer = StartupTimer()
@@ -0,0 +1,101 @@
+import asyncio
+import multiprocessing
+import signal
+from os import getenv
+from typing import Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from dotenv import load_dotenv
+from loguru import logger
+
+from metrics import handle_metrics
+
+load_dotenv()
+
+WEBHOOK_URL = getenv("webhook_url")
+WEBHOOK_PATH = getenv("webhook_path", "/webhook")
+WEBHOOK_SECRET = getenv("webhook_secret") or None
+WEBHOOK_HOST = getenv("webhook_host", "0.0.0.0")
+WEBHOOK_PORT = int(getenv("webhook_port", 8080))
+WEBHOOK_WORKERS = int(getenv("webhook_workers", 1))
+WEBHOOK_DRAIN_TIMEOUT = float(getenv("webhook_drain_timeout", 30))
+# Prometheus endpoint в том же приложении, пусто - выключен
+METRICS_PATH = getenv("metrics_path")
+
+
+class DrainingRequestHandler(SimpleRequestHandler):
+    """
+    On shutdown waits for updates that are still being handled before closing the bot session.
+    """
+
+    def __init__(self, *args, drain_timeout: float = WEBHOOK_DRAIN_TIMEOUT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.drain_timeout = drain_timeout
+
+    async def close(self) -> None:
+        pending = set(self._background_feed_update_tasks)
+        if pending:
+            logger.info(f"webhook: draining {len(pending)} in-flight updates")
+            done, not_done = await asyncio.wait(pending, timeout=self.drain_timeout)
+            if not_done:
+                logger.error(f"webhook: {len(not_done)} updates not finished in {self.drain_timeout}s")
+        await super().close()
+
+
+def build_app(dp: Dispatcher, bot: Bot, path: str = WEBHOOK_PATH, secret: Optional[str] = WEBHOOK_SECRET,
+              **kwargs) -> web.Application:
+    app = web.Application()
+    DrainingRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, **kwargs).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+    if METRICS_PATH:
+        app.router.add_get(METRICS_PATH, handle_metrics)
+    return app
+
+
+async def serve(dp: Dispatcher, bot: Bot, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT,
+                reuse_port: bool = False) -> None:
+    """
+    Serves webhook updates until SIGINT/SIGTERM, then stops accepting requests and drains the rest.
+    """
+    runner = web.AppRunner(build_app(dp, bot))
+    await runner.setup()
+    await web.TCPSite(runner, host, port, reuse_port=reuse_port).start()
+    logger.info(f"webhook: listening on {host}:{port}{WEBHOOK_PATH}")
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+
+
+async def set_webhook(bot: Bot) -> None:
+    await bot.set_webhook(f"{WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH}", secret_token=WEBHOOK_SECRET)
+    await bot.session.close()
+
+
+def run_workers(target, workers: int = WEBHOOK_WORKERS) -> None:
+    """
+    Starts `workers` processes calling `target()`, all listening on the same port (SO_REUSEPORT).
+    """
+    if workers <= 1:
+        target()
+        return
+    processes = [multiprocessing.Process(target=target, name=f"webhook-{i}") for i in range(workers)]
+    for p in processes:
+        p.start()
+
+    # SIGTERM приходит только родителю (docker stop) - передаем воркерам, они сами дорабатывают очередь
+    def terminate(*_):
+        for p in processes:
+            p.terminate()
+
+    signal.signal(signal.SIGTERM, terminate)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for p in processes:
+        p.join()